@@ -17,6 +17,7 @@ from users.models import Users
 from admin import forms
 from doc.models import Doc
 from news import models
+from news import rankings
 from course.models import Course, CourseCategory
 from course.models import Teacher
 
@@ -147,9 +148,7 @@ class HotNewsManageView(View):
         :param request:
         :return: 前端渲染页面
         """
-        hot_news = models.HotNews.objects.select_related('news__tag').only(
-            'news__title', 'news__tag__name', 'priority', 'news_id'
-        ).filter(is_delete=False).order_by('priority', '-news__clicks')[:constants.SHOW_HOTNEWS_COUNT]
+        hot_news = rankings.get_ranking(rankings.HOTNEWS, constants.SHOW_HOTNEWS_COUNT)
         return render(request, 'admin/news/news_hot.html', locals())
 
 
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class NewsConfig(AppConfig):
-    name = 'apps.news'
+    name = 'news'
+
+    def ready(self):
+        # 注册信号处理函数
+        from news import signals
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+新闻点击量缓冲计数
+访问详情页时只在redis哈希中 HINCRBY，由 flush_news_clicks 命令定期批量写回 tb_news，
+避免热门文章每次访问都对同一行加锁更新
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django_redis import get_redis_connection
+
+from news import constants
+from news import rankings
+from news import suggest
+
+logger = logging.getLogger('django')
+
+PENDING_KEY = 'news_clicks_pending'
+# 已从 PENDING_KEY 领取、尚未读出的增量，领取后进程中断时下次继续处理
+FLUSHING_KEY = 'news_clicks_flushing'
+
+
+def get_connection():
+    return get_redis_connection(alias='default')
+
+
+def incr(news_id, amount=1):
+    """记录一次点击"""
+    try:
+        get_connection().hincrby(PENDING_KEY, news_id, amount)
+    except Exception as e:
+        logger.error('点击量计数失败：\n{}'.format(e))
+
+
+def _apply(deltas):
+    """使用 CASE WHEN 批量更新点击量，queryset.update 不会修改 update_time 也不会触发信号"""
+    from news.models import News
+    whens = [When(id=news_id, then=Value(delta)) for news_id, delta in deltas.items()]
+    News.objects.filter(id__in=list(deltas)).update(
+        clicks=F('clicks') + Case(*whens, default=Value(0), output_field=IntegerField())
+    )
+
+
+def flush(batch_size=constants.CLICKS_FLUSH_BATCH_SIZE):
+    """
+    将redis中累计的点击增量写回数据库
+    增量先从redis中取出并删除，再写入数据库：进程在两者之间中断时会丢失这部分点击，但不会重复累加
+    :return: 写回的新闻数量
+    """
+    con = get_connection()
+    # 上次领取后未读出时，先处理遗留数据；否则将当前哈希整体改名，期间的新点击写入新的哈希
+    if not con.exists(FLUSHING_KEY):
+        try:
+            con.rename(PENDING_KEY, FLUSHING_KEY)
+        except Exception:
+            # PENDING_KEY不存在，没有需要写回的数据
+            return 0
+    p1 = con.pipeline()
+    p1.hgetall(FLUSHING_KEY)
+    p1.delete(FLUSHING_KEY)
+    raw = p1.execute()[0]
+    deltas = {}
+    for news_id, delta in raw.items():
+        delta = int(delta)
+        if delta:
+            deltas[int(news_id)] = delta
+
+    items = list(deltas.items())
+    for i in range(0, len(items), batch_size):
+        batch = dict(items[i:i + batch_size])
+        try:
+            with transaction.atomic():
+                _apply(batch)
+        except Exception:
+            # 数据库写入失败时，把尚未写入的增量加回待写回的哈希
+            p1 = con.pipeline()
+            for news_id, delta in items[i:]:
+                p1.hincrby(PENDING_KEY, news_id, delta)
+            p1.execute()
+            raise
+    if items:
+        # 点击量影响热门新闻、轮播图以及搜索提示的排序
+        rankings.rebuild_all()
+        suggest.mark_dirty()
+    return len(items)
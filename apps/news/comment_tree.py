@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+新闻评论树
+用 values() 查询取出评论，在内存中按id建立父评论关系并序列化，
+输出结构与 Comments.to_dict_data 相同，父评论嵌套层数有上限
+"""
+from itertools import chain
+
+from config import cursor_paginator
+from news import constants
+
+VALUES_FIELDS = ('id', 'news_id', 'content', 'update_time', 'parent_id', 'is_delete', 'author__username')
+
+
+def _to_flat_dict(row):
+    return {
+        'news_id': row['news_id'],
+        'content_id': row['id'],
+        'content': row['content'],
+        'author': row['author__username'],
+        'update_time': row['update_time'].strftime('%Y年%m月%d日 %H:%M'),
+    }
+
+
+def assemble(rows, parent_rows=(), max_depth=constants.COMMENT_PARENT_MAX_DEPTH):
+    """
+    :param rows: 需要输出的评论values()数据，需包含 id、news_id、content、author__username、update_time、parent_id
+    :param parent_rows: 只用于查找父评论的数据
+    :param max_depth: 父评论最多嵌套的层数，超出部分的parent为None
+    :return: 评论字典列表，顺序与rows一致
+    """
+    rows_by_id = {}
+    flat_by_id = {}
+    for row in chain(parent_rows, rows):
+        if row['id'] not in rows_by_id:
+            rows_by_id[row['id']] = row
+            flat_by_id[row['id']] = _to_flat_dict(row)
+
+    memo = {}
+
+    def serialize(comment_id, depth):
+        key = (comment_id, depth)
+        if key in memo:
+            return memo[key]
+        comment_dict = dict(flat_by_id[comment_id])
+        parent_id = rows_by_id[comment_id]['parent_id']
+        if parent_id in rows_by_id and depth < max_depth:
+            comment_dict['parent'] = serialize(parent_id, depth + 1)
+        else:
+            comment_dict['parent'] = None
+        memo[key] = comment_dict
+        return comment_dict
+
+    return [serialize(row['id'], 0) for row in rows]
+
+
+def _values(queryset):
+    return queryset.values(*VALUES_FIELDS)
+
+
+def get_comments_page(news_id, cursor, per_page, max_depth=constants.COMMENT_PARENT_MAX_DEPTH):
+    """
+    按 (update_time, id) 游标分页取评论，父评论逐层按id补查，查询次数不超过 max_depth + 1
+    :return: (评论字典列表, 下一页游标或None)
+    """
+    from news.models import Comments
+    rows, next_cursor = cursor_paginator.get_cursor_page(
+        _values(Comments.objects.filter(is_delete=False, news_id=news_id)), cursor, per_page,
+        key=lambda row: (row['update_time'], row['id']))
+
+    loaded = {row['id'] for row in rows}
+    parent_rows = []
+    level = rows
+    for _ in range(max_depth):
+        missing = {row['parent_id'] for row in level if row['parent_id'] and row['parent_id'] not in loaded}
+        if not missing:
+            break
+        level = list(_values(Comments.objects.filter(id__in=missing)))
+        loaded.update(row['id'] for row in level)
+        parent_rows.extend(level)
+    return assemble(rows, parent_rows, max_depth), next_cursor
@@ -7,4 +7,61 @@ PER_PAGE_NEWS_COUNT = 5
 SHOW_HOTNEWS_COUNT = 3
 
 # 显示轮播图数量
-SHOW_BANNER_COUNT = 6
\ No newline at end of file
+SHOW_BANNER_COUNT = 6
+
+# 进程内有效标签集合的过期时间，单位秒
+TAG_REGISTRY_TIMEOUT = 60
+
+# 新闻列表、轮播图缓存有效期，单位秒（失效靠代数变化，过期只用于回收旧代数的键）
+NEWS_LIST_CACHE_EXPIRES = 60 * 60
+
+# 点击量每批写回数据库的新闻数
+CLICKS_FLUSH_BATCH_SIZE = 500
+
+# 点击量写回数据库的间隔，单位秒
+CLICKS_FLUSH_INTERVAL = 60
+
+# 热门新闻、轮播图排行保存的最大条数
+RANKING_MAX_COUNT = 200
+
+# 评论中父评论最多嵌套的层数
+COMMENT_PARENT_MAX_DEPTH = 5
+
+# 每页评论数
+PER_PAGE_COMMENTS_COUNT = 10
+
+# 搜索索引队列每批处理的任务数
+SEARCH_QUEUE_BATCH_SIZE = 500
+
+# 搜索索引队列为空时的轮询间隔，单位秒
+SEARCH_QUEUE_INTERVAL = 2
+
+# 搜索结果缓存有效期，单位秒（索引更新时靠代数失效）
+SEARCH_CACHE_EXPIRES = 10 * 60
+
+# 热门查询统计保留的查询词数量
+SEARCH_HOT_QUERIES_MAX = 10000
+
+# 搜索索引重建的进程数
+SEARCH_REBUILD_WORKERS = 4
+
+# 搜索索引重建时每个进程每次处理的id区间大小
+SEARCH_REBUILD_CHUNK_SIZE = 1000
+
+# 搜索提示返回的条数
+SUGGEST_COUNT = 8
+
+# 每个新闻标题最多生成的前缀键数（标题本身及分隔符之后的部分）
+SUGGEST_KEYS_PER_TITLE = 5
+
+# 匹配条目超过该数量的前缀在建快照时预先计算结果，其余前缀查询时顺序扫描
+SUGGEST_SCAN_LIMIT = 256
+
+# 各进程检查搜索提示快照是否更新的间隔，单位秒
+SUGGEST_CHECK_INTERVAL = 1
+
+# 搜索提示快照标记为需要重建后，等待多少秒再重建，期间的多次修改只重建一次
+SUGGEST_REBUILD_DEBOUNCE = 5
+
+# rebuild_search_suggest --loop 检查重建标记的间隔，单位秒
+SUGGEST_REBUILD_INTERVAL = 1
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+新闻搜索索引的增量、并行重建
+增量：只处理 update_time 不早于水位线的新闻，处理完后把水位线推进到开始时的最大 update_time
+全量：写入新的索引（本地索引为新段，ES为新索引），全部写完后原子地切换别名，切换前旧索引照常提供搜索
+两种方式都按id区间分块，由进程池并行读取数据库（iterator() + only()）并生成索引文档
+"""
+import logging
+import multiprocessing
+import threading
+import time
+
+from django import db
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import caches
+from django.db.models import Max, Min
+from haystack import connections
+
+from news import constants
+from news import search_cache
+from news.models import News
+from news.search_queue import bulk_remove, get_identifier_by_pk
+from config.localsearch import store
+from config.localsearch.backend import LocalSearchBackend
+
+logger = logging.getLogger('django')
+
+WATERMARK_KEY = 'search_index_watermark_{}'
+
+
+def get_watermark(using):
+    return caches['default'].get(WATERMARK_KEY.format(using))
+
+
+def set_watermark(using, update_time):
+    caches['default'].set(WATERMARK_KEY.format(using), update_time, timeout=None)
+
+
+def split_chunks(queryset, chunk_size):
+    """按id区间分块，返回 [(起始id, 结束id), ...]，左闭右开"""
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    return [(low, min(low + chunk_size, bounds['high'] + 1))
+            for low in range(bounds['low'], bounds['high'] + 1, chunk_size)]
+
+
+def _get_index(using):
+    return connections[using].get_unified_index().get_index(News)
+
+
+def _init_worker():
+    # 子进程不能复用父进程的数据库连接，也不能复用父进程中已建立的搜索后端及其ES连接
+    db.connections.close_all()
+    connections.thread_local = threading.local()
+
+
+def _chunk_queryset(using, low, high, since):
+    queryset = _get_index(using).index_queryset(using=using).filter(id__gte=low, id__lt=high)
+    if since is not None:
+        queryset = queryset.filter(update_time__gte=since)
+    return queryset
+
+
+def _update_chunk(args):
+    """
+    增量：更新区间内变化的新闻，不在index_queryset中的（已删除等）从索引移除
+    :return: (更新数, 删除数)
+    """
+    using, low, high, since = args
+    backend = connections[using].get_backend()
+    index = _get_index(using)
+    objects = list(_chunk_queryset(using, low, high, since).iterator())
+    found = {obj.pk for obj in objects}
+    changed = News.objects.filter(id__gte=low, id__lt=high, update_time__gte=since).values_list('id', flat=True)
+    removed = [get_identifier_by_pk(News, pk) for pk in changed if pk not in found]
+    if objects:
+        backend.update(index, objects)
+    if removed:
+        bulk_remove(backend, removed)
+    return len(objects), len(removed)
+
+
+def _prepare_chunk(args):
+    """
+    全量（本地索引）：只生成文档，由父进程写入新段
+    :return: 增量操作列表
+    """
+    using, low, high = args
+    backend = connections[using].get_backend()
+    index = _get_index(using)
+    ops = (backend.prepare_document(index, obj) for obj in _chunk_queryset(using, low, high, None).iterator())
+    return [op for op in ops if op]
+
+
+def _write_chunk(args):
+    """
+    全量（ES）：写入新索引
+    :return: 文档数
+    """
+    using, low, high, index_name = args
+    backend = connections[using].get_backend()
+    backend.index_name = index_name
+    backend.setup_complete = False
+    objects = list(_chunk_queryset(using, low, high, None).iterator())
+    if objects:
+        backend.update(_get_index(using), objects, commit=False)
+    return len(objects)
+
+
+def _imap(func, tasks, workers):
+    """逐个产出各分块的结果，多进程时边计算边消费，不在内存中积累全部结果"""
+    if workers <= 1:
+        yield from map(func, tasks)
+        return
+    db.connections.close_all()
+    pool = multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker)
+    try:
+        yield from pool.imap_unordered(func, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def update(using='default', workers=constants.SEARCH_REBUILD_WORKERS,
+           chunk_size=constants.SEARCH_REBUILD_CHUNK_SIZE, replace_index=False):
+    """
+    增量更新，没有水位线时做全量重建
+    :return: (更新数, 删除数)
+    """
+    since = get_watermark(using)
+    if since is None:
+        return rebuild(using, workers, chunk_size, replace_index), 0
+    watermark = News.objects.aggregate(t=Max('update_time'))['t']
+    chunks = split_chunks(News.objects.filter(update_time__gte=since), chunk_size)
+    updated = removed = 0
+    for chunk_updated, chunk_removed in _imap(_update_chunk, [(using, low, high, since) for low, high in chunks],
+                                             workers):
+        updated += chunk_updated
+        removed += chunk_removed
+    if watermark:
+        set_watermark(using, watermark)
+    if updated or removed:
+        search_cache.bump_generation()
+    return updated, removed
+
+
+def needs_replace_index(using='default'):
+    """ES的索引名还是实体索引而不是别名时返回True，第一次切换前需要删除它"""
+    backend = connections[using].get_backend()
+    if isinstance(backend, LocalSearchBackend) or not hasattr(backend, 'conn'):
+        return False
+    conn = backend.conn
+    return not conn.indices.exists_alias(name=backend.index_name) and conn.indices.exists(index=backend.index_name)
+
+
+def rebuild(using='default', workers=constants.SEARCH_REBUILD_WORKERS,
+            chunk_size=constants.SEARCH_REBUILD_CHUNK_SIZE, replace_index=False):
+    """
+    全量重建到新索引后原子切换；重建期间由队列写入旧索引的变化，
+    本地索引在切换时重放到新段；ES中的更新因为 update_time 晚于开始时的水位线，会在下一次增量更新时补上
+    :param replace_index: ES的索引名还是实体索引时，允许删除它改为别名；删除到别名建立之间搜索返回404
+    :return: 文档数
+    """
+    backend = connections[using].get_backend()
+    if needs_replace_index(using) and not replace_index:
+        # 在写入新索引之前检查，不做无用的重建
+        raise ImproperlyConfigured('搜索索引{}是实体索引，第一次切换需要删除它（期间搜索返回404），'
+                                   '确认后加上 --replace-index 重新运行'.format(backend.index_name))
+    watermark = News.objects.aggregate(t=Max('update_time'))['t']
+    chunks = split_chunks(_get_index(using).index_queryset(using=using), chunk_size)
+
+    if isinstance(backend, LocalSearchBackend):
+        count = _rebuild_local(backend, using, chunks, workers)
+    elif hasattr(backend, 'conn') and hasattr(backend, 'index_name'):
+        count = _rebuild_elasticsearch(backend, using, chunks, workers)
+    else:
+        raise ImproperlyConfigured('搜索引擎{}不支持切换索引重建'.format(
+            connections.connections_info[using]['ENGINE']))
+
+    if watermark:
+        set_watermark(using, watermark)
+    search_cache.bump_generation()
+    return count
+
+
+def _rebuild_local(backend, using, chunks, workers):
+    count = 0
+
+    def documents():
+        # 每次只持有一个分块的文档，存储字段由 write_segment 边读边写入磁盘
+        nonlocal count
+        for chunk_ops in _imap(_prepare_chunk, [(using, low, high) for low, high in chunks], workers):
+            for op in chunk_ops:
+                count += 1
+                yield op['id'], op['terms'], op['length'], op['stored']
+
+    # 新段目录名唯一，写入时不需要加锁；写入期间队列仍在写旧段的delta.log，切换时重放到新段
+    store.begin_rebuild(backend.path)
+    name = store.write_segment(backend.path, documents())
+    store.finish_rebuild(backend.path, name)
+    return count
+
+
+def _rebuild_elasticsearch(backend, using, chunks, workers):
+    conn = backend.conn
+    alias = backend.index_name
+    new_index = '{}_{}'.format(alias, int(time.time()))
+
+    # 先在父进程中创建新索引和mapping
+    backend.index_name = new_index
+    backend.setup_complete = False
+    backend.setup()
+    try:
+        count = sum(_imap(_write_chunk, [(using, low, high, new_index) for low, high in chunks], workers))
+        conn.indices.refresh(index=new_index)
+    finally:
+        backend.index_name = alias
+        backend.setup_complete = False
+
+    actions = [{'add': {'index': new_index, 'alias': alias}}]
+    old_indexes = []
+    if conn.indices.exists_alias(name=alias):
+        old_indexes = list(conn.indices.get_alias(name=alias).keys())
+        actions = [{'remove': {'index': old, 'alias': alias}} for old in old_indexes] + actions
+    elif conn.indices.exists(index=alias):
+        # 第一次切换时别名与旧的实体索引同名，只能先删除旧索引（rebuild已检查replace_index），
+        # 新索引已写完，删除后立即建立别名，缩短搜索返回404的时间
+        logger.warning('搜索索引{}不是别名，删除后重新创建为别名'.format(alias))
+        conn.indices.delete(index=alias)
+    conn.indices.update_aliases(body={'actions': actions})
+    for old in old_indexes:
+        conn.indices.delete(index=old, ignore=404)
+    return count
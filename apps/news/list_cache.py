@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+新闻列表、轮播图接口的缓存
+缓存键中带有代数(generation)，News/Tag/Banner变化时只需将代数加一，
+旧代数的键不再被访问，等待过期即可，无需扫描删除
+"""
+import logging
+
+from django.core.cache import caches
+
+from news import constants
+
+logger = logging.getLogger('django')
+
+GENERATION_KEY = 'news_list_generation'
+HIT_KEY = 'news_list_cache_hit'
+MISS_KEY = 'news_list_cache_miss'
+
+
+def get_cache():
+    return caches['default']
+
+
+def get_generation():
+    """当前缓存代数"""
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY) or 1
+    return generation
+
+
+def bump_generation():
+    """代数加一，使所有已缓存的列表数据失效"""
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # 键不存在
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        cache.incr(GENERATION_KEY)
+    except Exception as e:
+        logger.error('新闻列表缓存代数更新失败：\n{}'.format(e))
+
+
+def make_key(name, params, generation=None):
+    generation = generation if generation is not None else get_generation()
+    return 'news_list_{}_{}_{}'.format(
+        generation, name, '_'.join(str(p) for p in params))
+
+
+def _count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_or_build(name, params, builder, generation=None):
+    """
+    读取缓存，未命中时调用builder生成数据并写入缓存
+    :param name: 接口名称，如 news、banners
+    :param params: 组成缓存键的参数
+    :param builder: 无参函数，返回可序列化的数据
+    :param generation: 已经读取过的缓存代数，为None时重新读取
+    :return: 数据
+    """
+    try:
+        key = make_key(name, params, generation)
+        data = get_cache().get(key)
+        if data is not None:
+            _count(HIT_KEY)
+            return data
+        _count(MISS_KEY)
+    except Exception as e:
+        # redis异常时直接查询数据库
+        logger.error('新闻列表缓存读取失败：\n{}'.format(e))
+        return builder()
+
+    # builder 的异常照常抛出，只有缓存读写出错时才退回数据库
+    data = builder()
+    try:
+        get_cache().set(key, data, constants.NEWS_LIST_CACHE_EXPIRES)
+    except Exception as e:
+        logger.error('新闻列表缓存写入失败：\n{}'.format(e))
+    return data
+
+
+def get_stats():
+    """命中、未命中次数"""
+    cache = get_cache()
+    hits = cache.get(HIT_KEY) or 0
+    misses = cache.get(MISS_KEY) or 0
+    total = hits + misses
+    return {
+        'generation': get_generation(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HIT_KEY, MISS_KEY])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+新闻列表序列化微基准
+对同一批内存数据分别测量：
+  model:  仿照原 NewListView，用 only()+select_related 的方式创建延迟字段模型实例，再逐行 strftime
+  values: values_list 元组 + 预编译日期格式串（serializers.news_list_data）
+不访问数据库，只比较每行的Python开销
+"""
+import timeit
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from news import serializers
+from news.models import News, Tag
+from users.models import Users
+
+NEWS_FIELD_NAMES = ['id', 'title', 'digest', 'image_url', 'update_time', 'tag_id', 'author_id']
+
+
+def make_rows(count):
+    now = timezone.now()
+    rows = []
+    for i in range(count):
+        rows.append((
+            i + 1, '新闻标题{}'.format(i), '新闻摘要' * 10, 'http://127.0.0.1:8888/group1/M00/{}.jpg'.format(i),
+            now - timedelta(minutes=i), 'Python基础', 'admin',
+        ))
+    return rows
+
+
+def model_path(rows):
+    """原实现：实例化模型后逐行 strftime"""
+    news_info = []
+    for news_id, title, digest, image_url, update_time, tag_name, author in rows:
+        n = News.from_db('default', NEWS_FIELD_NAMES, (news_id, title, digest, image_url, update_time, 1, 1))
+        News.tag.field.set_cached_value(n, Tag.from_db('default', ['id', 'name'], (1, tag_name)))
+        News.author.field.set_cached_value(n, Users.from_db('default', ['id', 'username'], (1, author)))
+        news_info.append(n)
+
+    news_info_list = []
+    for n in news_info:
+        news_info_list.append({
+            'id': n.id,
+            'title': n.title,
+            'digest': n.digest,
+            'image_url': n.image_url,
+            'update_time': n.update_time.strftime('%Y年%m月%d日 %H:%M'),
+            'tag_name': n.tag.name,
+            'author': n.author.username
+        })
+    return news_info_list
+
+
+def values_path(rows):
+    return serializers.news_list_data(rows)
+
+
+class Command(BaseCommand):
+    help = '比较新闻列表两种序列化方式的每行耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='每页行数')
+        parser.add_argument('--repeat', type=int, default=2000, help='重复次数')
+
+    def handle(self, *args, **options):
+        rows = make_rows(options['rows'])
+        if model_path(rows) != values_path(rows):
+            self.stderr.write('两种方式输出不一致')
+            return
+
+        results = {}
+        for name, func in (('model', model_path), ('values', values_path)):
+            seconds = min(timeit.repeat(lambda: func(rows), number=options['repeat'], repeat=3))
+            results[name] = seconds / options['repeat'] / options['rows'] * 1e6
+            self.stdout.write('{:<8}{:>10.2f} us/row'.format(name, results[name]))
+        self.stdout.write('speedup  {:>10.2f}x'.format(results['model'] / results['values']))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+搜索后端基准：本地磁盘索引 与 Elasticsearch
+语料取自 test_data/tb_comments_20181222x.sql 中的评论内容，每条评论作为一篇新闻（不写入数据库）
+两个后端都使用临时连接和临时索引，不影响 HAYSTACK_CONNECTIONS 中已有的索引
+报告建索引耗时、查询延迟 p50/p95/p99 和 QPS
+"""
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from haystack import connections
+from haystack.query import SearchQuerySet
+
+from news.models import News, Tag
+from users.models import Users
+from config.localsearch.tokenizer import tokenize
+
+CORPUS_FILE = os.path.join(settings.BASE_DIR, 'test_data', 'tb_comments_20181222x.sql')
+# INSERT INTO `tb_comments` VALUES (id, create_time, update_time, is_delete, 'content', author_id, news_id, parent_id);
+_ROW_RE = re.compile(r"VALUES \((\d+), '[^']*', '([^']*)', \d+, '((?:[^'\\]|\\.)*)'")
+
+LOCAL_ALIAS = 'bench_local'
+ES_ALIAS = 'bench_es'
+
+
+def load_corpus(file_path=CORPUS_FILE):
+    # 关联对象直接挂在内存中的News上，索引 tag__name、author__username 时不查询数据库
+    tag = Tag(id=1, name='bench')
+    author = Users(id=1, username='bench')
+    docs = []
+    with open(file_path, encoding='utf-8-sig') as f:
+        for line in f:
+            match = _ROW_RE.search(line)
+            if not match:
+                continue
+            pk, update_time, content = match.groups()
+            content = content.replace("\\'", "'")
+            docs.append(News(
+                id=int(pk), title=content[:20], digest=content[:50], content=content,
+                image_url='', tag=tag, author=author, clicks=0,
+                update_time=timezone.make_aware(parse_datetime(update_time)),
+            ))
+    return docs
+
+
+def make_queries(docs, count, seed=0):
+    """从语料中随机抽取1到3个词组成查询"""
+    rnd = random.Random(seed)
+    queries = []
+    while len(queries) < count:
+        tokens = tokenize(rnd.choice(docs).content)
+        if tokens:
+            queries.append(' '.join(rnd.sample(tokens, min(len(tokens), rnd.randint(1, 3)))))
+    return queries
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class Command(BaseCommand):
+    help = '在test_data语料上比较本地索引与Elasticsearch的建索引和查询性能'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=1000, help='查询次数')
+        parser.add_argument('--batch-size', type=int, default=500, help='建索引时每批文档数')
+        parser.add_argument('--es-url', default=settings.HAYSTACK_CONNECTIONS['default'].get('URL'),
+                            help='Elasticsearch地址，为空时只测本地索引')
+        parser.add_argument('--skip-es', action='store_true', help='不测Elasticsearch')
+
+    def handle(self, *args, **options):
+        docs = load_corpus()
+        queries = make_queries(docs, options['queries'])
+        self.stdout.write('语料 {} 篇，查询 {} 次'.format(len(docs), len(queries)))
+
+        index_path = tempfile.mkdtemp(prefix='bench_local_')
+        backends = [(LOCAL_ALIAS, {
+            'ENGINE': 'config.localsearch.backend.LocalSearchEngine',
+            'PATH': index_path,
+        })]
+        if options['es_url'] and not options['skip_es']:
+            backends.append((ES_ALIAS, {
+                'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
+                'URL': options['es_url'],
+                'INDEX_NAME': 'mysite_bench',
+            }))
+
+        try:
+            for alias, conn in backends:
+                connections.connections_info[alias] = conn
+                try:
+                    self.bench(alias, docs, queries, options['batch_size'])
+                except Exception as e:
+                    self.stderr.write('{} 测试失败：{}'.format(alias, e))
+                finally:
+                    try:
+                        connections[alias].get_backend().clear()
+                    except Exception:
+                        pass
+                    del connections.connections_info[alias]
+        finally:
+            shutil.rmtree(index_path, ignore_errors=True)
+
+    def bench(self, alias, docs, queries, batch_size):
+        backend = connections[alias].get_backend()
+        index = connections[alias].get_unified_index().get_index(News)
+        backend.clear()
+
+        start = time.perf_counter()
+        for i in range(0, len(docs), batch_size):
+            backend.update(index, docs[i:i + batch_size])
+        index_seconds = time.perf_counter() - start
+
+        per_page = settings.HAYSTACK_SEARCH_RESULTS_PER_PAGE
+        sqs = SearchQuerySet(using=alias).models(News)
+        latencies = []
+        hits = 0
+        start = time.perf_counter()
+        for q in queries:
+            t = time.perf_counter()
+            results = sqs.auto_query(q)
+            page = list(results[:per_page])
+            hits += bool(page)
+            latencies.append((time.perf_counter() - t) * 1000)
+        total_seconds = time.perf_counter() - start
+        latencies.sort()
+
+        self.stdout.write(
+            '{:<12} index {:>8.2f}s  p50 {:>7.2f}ms  p95 {:>7.2f}ms  p99 {:>7.2f}ms  '
+            'qps {:>8.1f}  hit {:>5.1f}%'.format(
+                alias, index_seconds, percentile(latencies, 50), percentile(latencies, 95),
+                percentile(latencies, 99), len(queries) / total_seconds, 100.0 * hits / len(queries)))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+对各视图的主要查询执行 EXPLAIN，报告仍在全表扫描或文件排序的查询
+支持 MySQL 与 SQLite
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from course.models import Course
+from doc.models import Doc
+from news import constants, models, views
+
+
+def view_querysets(tag_id, news_id):
+    """(名称, 查询集) 列表，与视图中的写法保持一致"""
+    return [
+        ('news.NewListView', views.NewListView.get_queryset(0)[:constants.PER_PAGE_NEWS_COUNT]),
+        ('news.NewListView(tag_id)', views.NewListView.get_queryset(tag_id)[:constants.PER_PAGE_NEWS_COUNT]),
+        ('news.NewsDetailView(comments)', models.Comments.objects.filter(
+            is_delete=False, news_id=news_id).order_by('-update_time', '-id')[:constants.PER_PAGE_COMMENTS_COUNT]),
+        ('news.IndexView(tags)', models.Tag.objects.only('id', 'name').filter(is_delete=False)),
+        ('news.rankings(hotnews)', models.HotNews.objects.select_related('news').filter(
+            is_delete=False).order_by('priority', '-news__clicks')),
+        ('news.rankings(banners)', models.Banner.objects.select_related('news').filter(
+            is_delete=False).order_by('priority', '-news__clicks')),
+        ('doc.doc_index', Doc.objects.filter(is_delete=False)),
+        ('course.course_list', Course.objects.select_related('teacher').filter(is_delete=False)),
+    ]
+
+
+def explain(queryset):
+    """
+    :return: (是否全表扫描, 是否文件排序, 执行计划的文本行)
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+            full_scan = any(d.startswith('SCAN') and 'USING' not in d for d in details)
+            filesort = any('TEMP B-TREE' in d for d in details)
+            return full_scan, filesort, details
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [col[0].lower() for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    full_scan = any(row.get('type') == 'ALL' for row in rows)
+    filesort = any('filesort' in (row.get('extra') or '') for row in rows)
+    lines = ['{table}: type={type} key={key} rows={rows} extra={extra}'.format(
+        **{k: row.get(k) for k in ('table', 'type', 'key', 'rows', 'extra')}) for row in rows]
+    return full_scan, filesort, lines
+
+
+class Command(BaseCommand):
+    help = '检查视图查询的执行计划，报告全表扫描和文件排序'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tag-id', type=int, default=1, help='用于标签过滤查询的标签id')
+        parser.add_argument('--news-id', type=int, default=1, help='用于评论查询的新闻id')
+        parser.add_argument('--verbose-plan', action='store_true', help='输出完整的执行计划')
+
+    def handle(self, *args, **options):
+        problems = 0
+        for name, queryset in view_querysets(options['tag_id'], options['news_id']):
+            full_scan, filesort, lines = explain(queryset)
+            flags = []
+            if full_scan:
+                flags.append('全表扫描')
+            if filesort:
+                flags.append('文件排序')
+            if flags:
+                problems += 1
+                self.stdout.write(self.style.WARNING('{:<32}{}'.format(name, '、'.join(flags))))
+            else:
+                self.stdout.write(self.style.SUCCESS('{:<32}OK'.format(name)))
+            if options['verbose_plan'] or flags:
+                for line in lines:
+                    self.stdout.write('    {}'.format(line))
+        self.stdout.write('共{}条查询存在问题'.format(problems))
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import clicks
+from news import constants
+
+
+class Command(BaseCommand):
+    help = '将redis中缓冲的新闻点击量批量写回数据库'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='常驻运行，按间隔定期写回')
+        parser.add_argument('--interval', type=int, default=constants.CLICKS_FLUSH_INTERVAL,
+                            help='写回间隔，单位秒')
+        parser.add_argument('--batch-size', type=int, default=constants.CLICKS_FLUSH_BATCH_SIZE,
+                            help='每批更新的新闻数')
+
+    def handle(self, *args, **options):
+        while True:
+            count = clicks.flush(batch_size=options['batch_size'])
+            self.stdout.write('已写回{}条新闻的点击量'.format(count))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from django.core.management.base import BaseCommand
+
+from news import list_cache
+
+
+class Command(BaseCommand):
+    help = '查看新闻列表缓存的命中情况'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='输出后清零计数')
+
+    def handle(self, *args, **options):
+        stats = list_cache.get_stats()
+        self.stdout.write('generation: {generation}\nhits: {hits}\nmisses: {misses}\n'
+                          'hit_rate: {hit_rate:.2%}'.format(**stats))
+        if options['reset']:
+            list_cache.reset_stats()
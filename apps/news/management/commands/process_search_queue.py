@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import constants
+from news import search_queue
+
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = '批量处理搜索索引队列中的更新、删除任务'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='常驻运行')
+        parser.add_argument('--interval', type=float, default=constants.SEARCH_QUEUE_INTERVAL,
+                            help='队列为空或出错时的等待时间，单位秒')
+        parser.add_argument('--batch-size', type=int, default=constants.SEARCH_QUEUE_BATCH_SIZE,
+                            help='每批处理的任务数')
+        parser.add_argument('--using', default='default', help='haystack连接名')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                count, updated, removed = search_queue.drain(options['batch_size'], options['using'])
+            except Exception as e:
+                # 搜索后端不可用时任务已放回队列，稍后重试
+                logger.error('搜索索引更新失败：\n{}'.format(e))
+                if not options['loop']:
+                    raise
+                time.sleep(options['interval'])
+                continue
+            if count:
+                self.stdout.write('处理{}条任务：更新{}，删除{}'.format(count, updated, removed))
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from django.core.management.base import BaseCommand
+
+from news import rankings
+
+
+class Command(BaseCommand):
+    help = '从数据库重建热门新闻、轮播图排行'
+
+    def handle(self, *args, **options):
+        rankings.rebuild_all()
+        self.stdout.write('排行重建完成')
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import constants
+from news import suggest
+
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = '从数据库重建搜索提示快照；--loop 时常驻运行，快照被标记需要重建后延迟重建'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='常驻运行，检查重建标记')
+        parser.add_argument('--interval', type=float, default=constants.SUGGEST_REBUILD_INTERVAL,
+                            help='检查间隔，单位秒')
+        parser.add_argument('--debounce', type=float, default=constants.SUGGEST_REBUILD_DEBOUNCE,
+                            help='标记后等待多少秒再重建')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            count = suggest.write_snapshot(suggest.collect_entries())
+            self.stdout.write('搜索提示快照已重建：{}条，{}'.format(count, suggest.SNAPSHOT_PATH))
+            return
+        # 启动时没有快照则先生成一次
+        if not os.path.exists(suggest.SNAPSHOT_PATH):
+            suggest.rebuild()
+        while True:
+            try:
+                count = suggest.rebuild_if_dirty(options['debounce'])
+                if count is not None:
+                    self.stdout.write('搜索提示快照已重建：{}条'.format(count))
+            except Exception as e:
+                logger.error('搜索提示快照重建失败：\n{}'.format(e))
+            time.sleep(options['interval'])
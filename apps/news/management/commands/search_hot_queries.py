@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from django.core.management.base import BaseCommand
+
+from news import search_cache
+
+
+class Command(BaseCommand):
+    help = '查看请求次数最多的搜索词及其缓存命中情况'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=200, help='显示的查询词数量')
+        parser.add_argument('--reset', action='store_true', help='输出后清零统计')
+
+    def handle(self, *args, **options):
+        total, queries = search_cache.get_hot_queries(options['top'])
+        self.stdout.write('generation: {}\ntotal: {}'.format(search_cache.get_generation(), total))
+        self.stdout.write('{:>5}{:>10}{:>9}{:>9}{:>9}  {}'.format('rank', 'count', 'share', 'cum', 'hit', 'query'))
+        cumulative = 0
+        for rank, row in enumerate(queries, 1):
+            cumulative += row['count']
+            self.stdout.write('{:>5}{:>10}{:>9.2%}{:>9.2%}{:>9.2%}  {}'.format(
+                rank, row['count'], row['count'] / total if total else 0.0,
+                cumulative / total if total else 0.0, row['hits'] / row['count'] if row['count'] else 0.0,
+                row['query']))
+        if options['reset']:
+            search_cache.reset_stats()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from news import constants
+from news import index_rebuild
+
+
+class Command(BaseCommand):
+    help = '按update_time水位线增量更新新闻搜索索引，--full时重建到新索引后原子切换'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='全量重建')
+        parser.add_argument('--workers', type=int, default=constants.SEARCH_REBUILD_WORKERS, help='进程数')
+        parser.add_argument('--chunk-size', type=int, default=constants.SEARCH_REBUILD_CHUNK_SIZE,
+                            help='每块的id区间大小')
+        parser.add_argument('--using', default='default', help='haystack连接名')
+        parser.add_argument('--replace-index', action='store_true',
+                            help='一次性迁移：ES的索引名还是实体索引时，删除它并改为指向新索引的别名；'
+                                 '从删除到别名建立的短时间内搜索返回404，之后的重建不再需要')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        try:
+            if options['full']:
+                count = index_rebuild.rebuild(options['using'], options['workers'], options['chunk_size'],
+                                              options['replace_index'])
+            else:
+                updated, removed = index_rebuild.update(options['using'], options['workers'],
+                                                        options['chunk_size'], options['replace_index'])
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+        if options['full']:
+            self.stdout.write('重建完成：{}条，耗时{:.1f}秒'.format(count, time.time() - start))
+        else:
+            self.stdout.write('增量更新完成：更新{}，删除{}，耗时{:.1f}秒'.format(updated, removed, time.time() - start))
+        self.stdout.write('水位线：{}'.format(index_rebuild.get_watermark(options['using'])))
@@ -0,0 +1,25 @@
+# Generated by Django 2.1.15 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0007_auto_20190527_1655'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['news', 'is_delete', 'update_time', 'id'], name='comments_news_del_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['is_delete', 'tag', 'update_time', 'id'], name='news_del_tag_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['is_delete', 'update_time', 'id'], name='news_del_time_idx'),
+        ),
+    ]
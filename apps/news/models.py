@@ -32,6 +32,11 @@ class News(ModelBase):
 
     class Meta:
         ordering = ['-update_time', '-id']
+        # 与 is_delete=False [, tag_id=?] ORDER BY update_time DESC, id DESC 的查询对应
+        indexes = [
+            models.Index(fields=['is_delete', 'tag', 'update_time', 'id'], name='news_del_tag_time_idx'),
+            models.Index(fields=['is_delete', 'update_time', 'id'], name='news_del_time_idx'),
+        ]
         db_table = "tb_news"  # 指明数据库表名
         verbose_name = "新闻"  # 在admin站点中显示的名称
         verbose_name_plural = verbose_name  # 显示的复数名称
@@ -63,6 +68,9 @@ class Comments(ModelBase):
 
     class Meta:
         ordering = ['-update_time', '-id']
+        indexes = [
+            models.Index(fields=['news', 'is_delete', 'update_time', 'id'], name='comments_news_del_time_idx'),
+        ]
         db_table = "tb_comments"  # 指明数据库表名
         verbose_name = "评论"  # 在admin站点中显示的名称
         verbose_name_plural = verbose_name  # 显示的复数名称
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+热门新闻、轮播图排行
+按 priority, -news__clicks 排好序的结果连同页面需要的字段一起保存在redis列表中，
+首页、轮播图接口、搜索页和后台热门新闻管理页直接读取，不再查询数据库。
+HotNews/Banner/News 变化或点击量写回数据库后重建。
+"""
+import json
+import logging
+
+from django_redis import get_redis_connection
+
+from news import constants
+
+logger = logging.getLogger('django')
+
+HOTNEWS = 'hotnews'
+BANNERS = 'banners'
+
+
+def get_connection():
+    return get_redis_connection(alias='default')
+
+
+def _list_key(name):
+    return 'news_ranking_{}'.format(name)
+
+
+def _version_key(name):
+    # 每次重建加一，同时表示排行是否已经建立
+    return 'news_ranking_{}_version'.format(name)
+
+
+def _hotnews_rows():
+    from news.models import HotNews
+    priority_dict = dict(HotNews.PRI_CHOICES)
+    hot_news = HotNews.objects.select_related('news__tag', 'news__author').only(
+        'priority', 'update_time', 'news_id', 'news__title', 'news__image_url', 'news__digest',
+        'news__clicks', 'news__tag__name', 'news__author__username'
+    ).filter(is_delete=False).order_by('priority', '-news__clicks')[:constants.RANKING_MAX_COUNT]
+    rows = []
+    for h in hot_news:
+        rows.append({
+            'id': h.id,
+            'news_id': h.news_id,
+            'title': h.news.title,
+            'image_url': h.news.image_url,
+            'digest': h.news.digest,
+            'tag_name': h.news.tag.name if h.news.tag else '',
+            'author': h.news.author.username if h.news.author else '',
+            'priority': h.priority,
+            'priority_display': priority_dict.get(h.priority, ''),
+            'update_time': h.update_time.strftime('%Y年%m月%d日 %H:%M'),
+        })
+    return rows
+
+
+def _banner_rows():
+    from news.models import Banner
+    banners = Banner.objects.select_related('news').only(
+        'image_url', 'news_id', 'news__title'
+    ).filter(is_delete=False).order_by(
+        'priority', '-news__clicks'
+    )[:constants.RANKING_MAX_COUNT]
+    rows = []
+    for b in banners:
+        rows.append({
+            'image_url': b.image_url,
+            'news_id': b.news_id,
+            'news_title': b.news.title
+        })
+    return rows
+
+
+_BUILDERS = {
+    HOTNEWS: _hotnews_rows,
+    BANNERS: _banner_rows,
+}
+
+
+def rebuild(name):
+    """
+    从数据库重建排行，先写入临时键再改名，读取方不会看到写了一半的列表
+    :return: 排行数据
+    """
+    rows = _BUILDERS[name]()
+    key = _list_key(name)
+    tmp_key = '{}_tmp'.format(key)
+    p1 = get_connection().pipeline()
+    p1.delete(tmp_key)
+    if rows:
+        p1.rpush(tmp_key, *[json.dumps(r) for r in rows])
+        p1.rename(tmp_key, key)
+    else:
+        p1.delete(key)
+    p1.incr(_version_key(name))
+    p1.execute()
+    return rows
+
+
+def rebuild_all():
+    for name in _BUILDERS:
+        try:
+            rebuild(name)
+        except Exception as e:
+            logger.error('排行{}重建失败：\n{}'.format(name, e))
+
+
+def get_ranking(name, count=None):
+    """
+    读取排行
+    :param name: HOTNEWS 或 BANNERS
+    :param count: 取前多少条，None表示全部
+    :return: 字典列表
+    """
+    end = count - 1 if count else -1
+    try:
+        p1 = get_connection().pipeline()
+        p1.exists(_version_key(name))
+        p1.lrange(_list_key(name), 0, end)
+        built, raw = p1.execute()
+    except Exception as e:
+        # redis异常时直接查询数据库
+        logger.error('排行{}读取失败：\n{}'.format(name, e))
+        rows = _BUILDERS[name]()
+        return rows[:count] if count else rows
+    if not built:
+        rows = rebuild(name)
+        return rows[:count] if count else rows
+    return [json.loads(r) for r in raw]
+
+
+def get_version(name):
+    """排行的版本号，每次重建加一，用于生成ETag"""
+    try:
+        return int(get_connection().get(_version_key(name)) or 0)
+    except Exception as e:
+        logger.error('排行{}版本读取失败：\n{}'.format(name, e))
+        return None
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+搜索结果缓存
+按 (索引代数, 归一化后的查询词, 过滤条件, 页码) 缓存当前页结果的id和存储字段、命中总数以及分面统计，
+索引更新时将代数加一使全部缓存失效
+每个查询词的请求次数和缓存命中次数记录在redis有序集合中，用于热门查询统计
+"""
+import hashlib
+import logging
+
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from haystack.models import SearchResult
+
+from news import constants
+from config.localsearch.tokenizer import normalize
+
+logger = logging.getLogger('django')
+
+GENERATION_KEY = 'search_index_generation'
+# 查询词 -> 请求次数
+QUERY_COUNT_KEY = 'search_query_count'
+# 查询词 -> 缓存命中次数
+QUERY_HIT_KEY = 'search_query_hit'
+# 全部请求次数（有序集合会截断，总数单独记录）
+QUERY_TOTAL_KEY = 'search_query_total'
+
+
+def get_cache():
+    return caches['default']
+
+
+def get_connection():
+    return get_redis_connection(alias='default')
+
+
+def normalize_query(query):
+    """全角转半角、转小写、合并连续空白"""
+    return ' '.join(normalize(query).split())
+
+
+def get_generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY) or 1
+    return generation
+
+
+def bump_generation():
+    """索引内容变化后调用，使已缓存的搜索结果失效"""
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        cache.incr(GENERATION_KEY)
+    except Exception as e:
+        logger.error('搜索缓存代数更新失败：\n{}'.format(e))
+
+
+def make_key(query, page, generation, filters=()):
+    digest = hashlib.md5('{}|{}'.format(query, filters).encode('utf8')).hexdigest()
+    return 'search_{}_{}_{}'.format(generation, digest, page)
+
+
+def dump_results(results):
+    """SearchResult -> 可缓存的元组"""
+    return [
+        (r.app_label, r.model_name, r.pk, r.score, r.get_additional_fields())
+        for r in results
+    ]
+
+
+def load_results(rows, result_class=SearchResult):
+    return [result_class(app_label, model_name, pk, score, **fields)
+            for app_label, model_name, pk, score, fields in rows]
+
+
+def record(query, hit):
+    """记录一次查询，有序集合只保留请求次数最多的若干个查询词"""
+    # ZINCRBY 的参数顺序在 redis-py 2.x/3.x 中不同，直接发送命令
+    try:
+        pipeline = get_connection().pipeline()
+        pipeline.incr(QUERY_TOTAL_KEY)
+        pipeline.execute_command('ZINCRBY', QUERY_COUNT_KEY, 1, query)
+        if hit:
+            pipeline.execute_command('ZINCRBY', QUERY_HIT_KEY, 1, query)
+        pipeline.zremrangebyrank(QUERY_COUNT_KEY, 0, -constants.SEARCH_HOT_QUERIES_MAX - 1)
+        pipeline.zremrangebyrank(QUERY_HIT_KEY, 0, -constants.SEARCH_HOT_QUERIES_MAX - 1)
+        pipeline.execute()
+    except Exception as e:
+        logger.error('搜索查询统计失败：\n{}'.format(e))
+
+
+def get_or_build(query, page, builder, filters=()):
+    """
+    :param query: 归一化后的查询词
+    :param page: 页码
+    :param builder: 无参函数，返回 (命中总数, 当前页SearchResult列表, 分面统计)
+    :param filters: 过滤条件，可repr的元组
+    :return: (命中总数, 当前页SearchResult列表, 分面统计)
+    """
+    try:
+        key = make_key(query, page, get_generation(), filters)
+        data = get_cache().get(key)
+    except Exception as e:
+        logger.error('搜索缓存读取失败：\n{}'.format(e))
+        return builder()
+
+    record(query, data is not None)
+    if data is not None:
+        hits, rows, facets = data
+        return hits, load_results(rows), facets
+
+    # builder 的异常照常抛出，只有缓存读写出错时才退回直接搜索
+    hits, results, facets = builder()
+    try:
+        get_cache().set(key, (hits, dump_results(results), facets), constants.SEARCH_CACHE_EXPIRES)
+    except Exception as e:
+        logger.error('搜索缓存写入失败：\n{}'.format(e))
+    return hits, results, facets
+
+
+def get_hot_queries(count=200):
+    """
+    :return: (全部请求次数, [{'query', 'count', 'hits'}, ...])，按请求次数降序
+    """
+    connection = get_connection()
+    total = int(connection.get(QUERY_TOTAL_KEY) or 0)
+    rows = connection.zrevrange(QUERY_COUNT_KEY, 0, count - 1, withscores=True)
+    pipeline = connection.pipeline()
+    for query, _ in rows:
+        pipeline.zscore(QUERY_HIT_KEY, query)
+    hit_scores = pipeline.execute() if rows else []
+    return total, [
+        {'query': query.decode('utf8'), 'count': int(score), 'hits': int(hit or 0)}
+        for (query, score), hit in zip(rows, hit_scores)
+    ]
+
+
+def reset_stats():
+    get_connection().delete(QUERY_TOTAL_KEY, QUERY_COUNT_KEY, QUERY_HIT_KEY)
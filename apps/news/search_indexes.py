@@ -3,6 +3,7 @@
 # 在apps/news/search_indexes.py中创建如下类：（名称固定为search_indexes.py）
 
 
+from django.utils import timezone
 from haystack import indexes
 # from haystack import site
 
@@ -13,12 +14,23 @@ class NewsIndex(indexes.SearchIndex, indexes.Indexable):
     """
     News索引数据模型类
     """
+    # 建索引时从数据库读取的字段，包括text模板中用到的字段
+    INDEX_FIELDS = ('id', 'title', 'digest', 'content', 'image_url', 'update_time', 'tag__name', 'author__username')
+
     text = indexes.CharField(document=True, use_template=True)
-    id = indexes.IntegerField(model_attr='id')
+    # 不能命名为id：会覆盖haystack的文档标识(app_label.model_name.pk)，按标识删除时匹配不到
+    news_id = indexes.IntegerField(model_attr='id')
     title = indexes.CharField(model_attr='title')
     digest = indexes.CharField(model_attr='digest')
-    content = indexes.CharField(model_attr='content')
+    # 正文已包含在text中，不再单独存储
+    content = indexes.CharField(model_attr='content', stored=False)
     image_url = indexes.CharField(model_attr='image_url')
+    # 以下字段供搜索结果页直接渲染，不再通过 SearchResult.object 查询数据库
+    # tag_id、tag_name、update_time 同时用于过滤，tag_id 用于按标签统计分面
+    tag_id = indexes.IntegerField(model_attr='tag_id', null=True, faceted=True)
+    tag_name = indexes.CharField(model_attr='tag__name', null=True)
+    author = indexes.CharField(model_attr='author__username', null=True, indexed=False)
+    update_time = indexes.DateTimeField(model_attr='update_time')
     # comments = indexes.IntegerField(model_attr='comments')
 
     def get_model(self):
@@ -31,4 +43,9 @@ class NewsIndex(indexes.SearchIndex, indexes.Indexable):
         """
 
         # return self.get_model().objects.filter(is_delete=False, tag_id=1)
-        return self.get_model().objects.filter(is_delete=False, tag_id__in=[1,2,3,4,5,6])
\ No newline at end of file
+        return self.get_model().objects.select_related('tag', 'author').only(*self.INDEX_FIELDS).filter(
+            is_delete=False, tag_id__in=[1,2,3,4,5,6])
+
+    def prepare_update_time(self, obj):
+        """按本地时区存储，各后端取回后显示一致"""
+        return timezone.localtime(obj.update_time)
\ No newline at end of file
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+搜索索引异步更新
+QueuedSignalProcessor 代替 haystack 的 RealtimeSignalProcessor：模型保存、删除时只把
+(model, pk, action) 放入redis列表，由 process_search_queue 命令批量取出、去重后
+调用后端的批量更新/删除接口。请求内不再同步访问 Elasticsearch，ES 不可用时也不影响写库。
+"""
+import json
+import logging
+
+from django.db import models, transaction
+from django_redis import get_redis_connection
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+
+from news import constants
+from news import search_cache
+
+logger = logging.getLogger('django')
+
+QUEUE_KEY = 'search_index_queue'
+
+ACTION_UPDATE = 'update'
+ACTION_DELETE = 'delete'
+
+
+def get_connection():
+    return get_redis_connection(alias='default')
+
+
+def enqueue(label, pk, action):
+    """
+    :param label: 模型标识，如 news.news
+    :param pk: 主键
+    :param action: ACTION_UPDATE 或 ACTION_DELETE
+    """
+    try:
+        get_connection().lpush(QUEUE_KEY, json.dumps([label, pk, action]))
+    except Exception as e:
+        # 入队失败只记录日志，不影响写库
+        logger.error('搜索索引任务入队失败[{} {} {}]：\n{}'.format(label, pk, action, e))
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """只处理建立了索引的模型，事务提交后入队"""
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def _is_indexed(self, sender, instance):
+        for using in self.connection_router.for_write(instance=instance):
+            try:
+                self.connections[using].get_unified_index().get_index(sender)
+                return True
+            except NotHandled:
+                continue
+        return False
+
+    def _enqueue_on_commit(self, sender, instance, action):
+        if not self._is_indexed(sender, instance):
+            return
+        label = sender._meta.label_lower
+        pk = instance.pk
+        transaction.on_commit(lambda: enqueue(label, pk, action))
+
+    def handle_save(self, sender, instance, **kwargs):
+        self._enqueue_on_commit(sender, instance, ACTION_UPDATE)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        self._enqueue_on_commit(sender, instance, ACTION_DELETE)
+
+
+def pop_batch(batch_size):
+    """
+    从队列尾部（最早入队）取出至多batch_size条任务
+    :return: [(label, pk, action), ...]，按入队先后排列
+    """
+    p1 = get_connection().pipeline(transaction=True)
+    p1.lrange(QUEUE_KEY, -batch_size, -1)
+    p1.ltrim(QUEUE_KEY, 0, -batch_size - 1)
+    raw, _ = p1.execute()
+    # lpush入队，列表尾部最早
+    return [tuple(json.loads(item)) for item in reversed(raw)]
+
+
+def requeue(tasks):
+    """处理失败的任务放回队列尾部，下次优先处理"""
+    if tasks:
+        get_connection().rpush(QUEUE_KEY, *[json.dumps(list(t)) for t in reversed(tasks)])
+
+
+def dedupe(tasks):
+    """
+    同一对象只保留最后一次操作
+    :return: {label: {pk: action}}
+    """
+    result = {}
+    for label, pk, action in tasks:
+        result.setdefault(label, {})[pk] = action
+    return result
+
+
+def get_identifier_by_pk(model, pk):
+    """与 haystack.utils.get_identifier 相同的文档id：app_label.model_name.pk"""
+    return '{}.{}'.format(model._meta.label_lower, pk)
+
+
+def bulk_remove(backend, identifiers):
+    """批量删除索引文档"""
+    if hasattr(backend, 'bulk_remove'):
+        backend.bulk_remove(identifiers)
+    elif hasattr(backend, 'conn') and hasattr(backend, 'index_name'):
+        # Elasticsearch
+        from elasticsearch.helpers import bulk
+        actions = [{'_op_type': 'delete', '_index': backend.index_name, '_type': 'modelresult', '_id': i}
+                   for i in identifiers]
+        bulk(backend.conn, actions, raise_on_error=False)
+        backend.conn.indices.refresh(index=backend.index_name)
+    else:
+        for identifier in identifiers:
+            backend.remove(identifier, commit=False)
+
+
+def process(tasks, using='default'):
+    """
+    批量更新索引
+    :param tasks: pop_batch 取出的任务
+    :return: (更新数, 删除数)
+    """
+    from django.apps import apps
+    from haystack import connections
+
+    unified_index = connections[using].get_unified_index()
+    backend = connections[using].get_backend()
+    updated = removed = 0
+    for label, actions in dedupe(tasks).items():
+        model = apps.get_model(label)
+        try:
+            index = unified_index.get_index(model)
+        except NotHandled:
+            continue
+        update_pks = [pk for pk, action in actions.items() if action == ACTION_UPDATE]
+        objects = list(index.index_queryset(using=using).filter(pk__in=update_pks)) if update_pks else []
+        # 不在 index_queryset 中的对象（如已逻辑删除）从索引中移除
+        found = {obj.pk for obj in objects}
+        remove_pks = [pk for pk in actions if pk not in found]
+        if objects:
+            backend.update(index, objects)
+            updated += len(objects)
+        if remove_pks:
+            bulk_remove(backend, [get_identifier_by_pk(model, pk) for pk in remove_pks])
+            removed += len(remove_pks)
+    if updated or removed:
+        search_cache.bump_generation()
+    return updated, removed
+
+
+def drain(batch_size=constants.SEARCH_QUEUE_BATCH_SIZE, using='default'):
+    """
+    处理一批任务，失败时放回队列
+    :return: (取出任务数, 更新数, 删除数)
+    """
+    tasks = pop_batch(batch_size)
+    if not tasks:
+        return 0, 0, 0
+    try:
+        updated, removed = process(tasks, using)
+    except Exception:
+        requeue(tasks)
+        raise
+    return len(tasks), updated, removed
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+新闻列表的投影序列化
+直接使用 values_list() 的元组生成JSON数据，不创建模型实例，
+日期格式化使用预编译的格式串代替逐行 strftime
+"""
+# NewListView 需要的字段，顺序与 news_list_data 中的解包一致
+NEWS_LIST_FIELDS = ('id', 'title', 'digest', 'image_url', 'update_time', 'tag__name', 'author__username')
+
+# 与 strftime('%Y年%m月%d日 %H:%M') 输出一致
+_DATE_FORMAT = '{0.year:04d}年{0.month:02d}月{0.day:02d}日 {0.hour:02d}:{0.minute:02d}'
+
+
+def make_date_formatter(tz=None):
+    """
+    :param tz: 目标时区，None表示按datetime自身时区输出（与原 strftime 行为一致）
+    :return: 接受aware datetime、返回格式化字符串的函数
+    """
+    fmt = _DATE_FORMAT.format
+    if tz is None:
+        return fmt
+
+    def format_date(dt):
+        return fmt(dt.astimezone(tz))
+    return format_date
+
+
+format_date = make_date_formatter()
+
+
+def news_list_key(row):
+    """游标分页使用的 (update_time, id)"""
+    return row[4], row[0]
+
+
+def news_list_data(rows, date_formatter=format_date):
+    """
+    :param rows: 按 NEWS_LIST_FIELDS 取出的 values_list 数据
+    :return: 与 NewListView 原输出相同结构的字典列表
+    """
+    return [
+        {
+            'id': news_id,
+            'title': title,
+            'digest': digest,
+            'image_url': image_url,
+            'update_time': date_formatter(update_time),
+            'tag_name': tag_name,
+            'author': author,
+        }
+        for news_id, title, digest, image_url, update_time, tag_name, author in rows
+    ]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from news import models
+from news import list_cache
+from news import rankings
+from news import suggest
+from news.tag_registry import tag_registry
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+def invalidate_tag_registry(sender, **kwargs):
+    """标签变化时清空进程内的有效标签集合"""
+    tag_registry.invalidate()
+
+
+@receiver(post_save, sender=models.News)
+@receiver(post_delete, sender=models.News)
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+@receiver(post_save, sender=models.Banner)
+@receiver(post_delete, sender=models.Banner)
+def invalidate_list_cache(sender, **kwargs):
+    """
+    新闻、标签、轮播图变化时，在事务提交后使列表缓存失效；
+    提交前加一的话，并发请求可能读到旧数据并缓存到新代数下
+    """
+    transaction.on_commit(list_cache.bump_generation)
+
+
+@receiver(post_save, sender=models.HotNews)
+@receiver(post_delete, sender=models.HotNews)
+@receiver(post_save, sender=models.Banner)
+@receiver(post_delete, sender=models.Banner)
+@receiver(post_save, sender=models.News)
+@receiver(post_delete, sender=models.News)
+def rebuild_rankings(sender, **kwargs):
+    """热门新闻、轮播图或新闻变化时，在事务提交后重建排行"""
+    transaction.on_commit(rankings.rebuild_all)
+
+
+@receiver(post_save, sender=models.News)
+@receiver(post_delete, sender=models.News)
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+def rebuild_suggest(sender, **kwargs):
+    """新闻或标签变化时，在事务提交后标记搜索提示快照需要重建"""
+    transaction.on_commit(suggest.mark_dirty)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+搜索框输入提示
+新闻标题、标签名归一化后按字节序排成有序数组写入快照文件，各进程mmap共享，
+查询时二分查找前缀的起点，再在前缀范围内按点击量取前几条；
+匹配条目过多的前缀（多为一两个字的短前缀）在建快照时预先算好结果
+快照文件格式：
+    头部       '<4sIII'     魔数, 版本, 条目数, 前缀数
+    条目数组   '<IHIHfIB'   键偏移, 键长度, 文本偏移, 文本长度, 分数, id, 类型
+    前缀数组   '<IHII'      前缀偏移, 前缀长度, 结果偏移, 结果条数
+    数据区     utf8 的键、显示文本、前缀，以及前缀的结果（uint32 条目序号）
+新闻、标签变化时只标记需要重建，由 rebuild_search_suggest --loop 在等待 SUGGEST_REBUILD_DEBOUNCE 秒后重建，
+写入临时文件后原子替换，读取方发现文件变化后重新映射；快照生成之前搜索提示为空
+"""
+import heapq
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q, Sum
+
+from news import constants
+from news import models
+from config.localsearch.tokenizer import normalize
+
+logger = logging.getLogger('django')
+
+SNAPSHOT_PATH = os.path.join(settings.BASE_DIR, 'search_index', 'suggest.snapshot')
+# 第一次标记需要重建的时间
+DIRTY_KEY = 'search_suggest_dirty'
+
+_MAGIC = b'SUGG'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIII')
+_ENTRY = struct.Struct('<IHIHfIB')
+_PREFIX = struct.Struct('<IHII')
+
+TYPE_NEWS = 0
+TYPE_TAG = 1
+TYPE_NAMES = {TYPE_NEWS: 'news', TYPE_TAG: 'tag'}
+
+# 标题中的分隔符，分隔符之后的部分也作为前缀键，输入标题中间的词也能匹配
+_SEPARATOR_RE = re.compile(r'[\s,，.。:：;；、|｜/\\\-—_()（）\[\]【】《》<>"“”\'‘’!！?？]+')
+
+
+def normalize_prefix(text):
+    return ' '.join(normalize(text).split())
+
+
+def title_keys(title):
+    """标题本身以及各分隔符之后的部分"""
+    key = normalize_prefix(title)
+    keys = [key]
+    for match in _SEPARATOR_RE.finditer(key):
+        rest = key[match.end():]
+        if rest and len(keys) < constants.SUGGEST_KEYS_PER_TITLE:
+            keys.append(rest)
+    return keys
+
+
+def collect_entries():
+    """
+    :return: [(键, 显示文本, 分数, id, 类型), ...]
+    """
+    entries = []
+    news_rows = models.News.objects.filter(is_delete=False).values_list('id', 'title', 'clicks')
+    for news_id, title, news_clicks in news_rows:
+        for key in title_keys(title):
+            entries.append((key, title, float(news_clicks or 0), news_id, TYPE_NEWS))
+    tag_rows = models.Tag.objects.filter(is_delete=False).annotate(
+        tag_clicks=Sum('news__clicks', filter=Q(news__is_delete=False))
+    ).values_list('id', 'name', 'tag_clicks')
+    for tag_id, name, tag_clicks in tag_rows:
+        entries.append((normalize_prefix(name), name, float(tag_clicks or 0), tag_id, TYPE_TAG))
+    return entries
+
+
+def _top(encoded, members):
+    """members中分数最高的条目序号，同一新闻或标签只取一次"""
+    top = []
+    seen = set()
+    for i in sorted(members, key=lambda i: (-encoded[i][2], i)):
+        ident = (encoded[i][4], encoded[i][3])
+        if ident in seen:
+            continue
+        seen.add(ident)
+        top.append(i)
+        if len(top) >= constants.SUGGEST_COUNT:
+            break
+    return top
+
+
+def top_prefixes(encoded):
+    """
+    预先计算匹配条目超过 SUGGEST_SCAN_LIMIT 的前缀的结果，其余前缀查询时顺序扫描
+    前缀的匹配范围不超过上限时，更长的前缀也不会超过，无需继续展开
+    :param encoded: 已排序的条目
+    :return: 按前缀字节序排列的 [(前缀, [条目序号, ...]), ...]
+    """
+    keys = [e[0].decode('utf8') for e in encoded]
+    result = []
+    candidates = range(len(encoded))
+    n = 1
+    while candidates:
+        groups = {}
+        for i in candidates:
+            if len(keys[i]) >= n:
+                groups.setdefault(keys[i][:n], []).append(i)
+        candidates = []
+        for prefix, members in groups.items():
+            if len(members) > constants.SUGGEST_SCAN_LIMIT:
+                result.append((prefix.encode('utf8'), _top(encoded, members)))
+                candidates.extend(members)
+        n += 1
+    result.sort()
+    return result
+
+
+def write_snapshot(entries, path=SNAPSHOT_PATH):
+    """按键的utf8字节序排序后写入临时文件，再原子替换快照"""
+    encoded = sorted(
+        ((key.encode('utf8')[:0xffff], text.encode('utf8')[:0xffff], score, ref, kind)
+         for key, text, score, ref, kind in entries if key),
+        key=lambda e: (e[0], -e[2]))
+    prefixes = top_prefixes(encoded)
+    base = _HEADER.size + _ENTRY.size * len(encoded) + _PREFIX.size * len(prefixes)
+    entry_table = bytearray()
+    prefix_table = bytearray()
+    data = bytearray()
+    for key, text, score, ref, kind in encoded:
+        key_offset = base + len(data)
+        data += key
+        text_offset = base + len(data)
+        data += text
+        entry_table += _ENTRY.pack(key_offset, len(key), text_offset, len(text), score, ref, kind)
+    for prefix, top in prefixes:
+        prefix_offset = base + len(data)
+        data += prefix
+        top_offset = base + len(data)
+        data += struct.pack('<{}I'.format(len(top)), *top)
+        prefix_table += _PREFIX.pack(prefix_offset, len(prefix), top_offset, len(top))
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.suggest_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(encoded), len(prefixes)))
+            f.write(entry_table)
+            f.write(prefix_table)
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+    return len(encoded)
+
+
+def rebuild(path=SNAPSHOT_PATH):
+    """从数据库重建快照"""
+    try:
+        return write_snapshot(collect_entries(), path)
+    except Exception as e:
+        logger.error('搜索提示快照重建失败：\n{}'.format(e))
+
+
+def mark_dirty():
+    """标记快照需要重建，已有标记时保留最早的时间，持续修改也不会无限推迟重建"""
+    try:
+        caches['default'].add(DIRTY_KEY, time.time(), timeout=None)
+    except Exception as e:
+        logger.error('搜索提示重建标记失败：\n{}'.format(e))
+
+
+def rebuild_if_dirty(debounce=constants.SUGGEST_REBUILD_DEBOUNCE):
+    """
+    标记时间已超过debounce秒时重建；先清除标记再重建，重建期间的修改会重新标记
+    :return: 重建的条目数，未重建时为None
+    """
+    cache = caches['default']
+    marked_at = cache.get(DIRTY_KEY)
+    if marked_at is None or time.time() - marked_at < debounce:
+        return None
+    cache.delete(DIRTY_KEY)
+    return rebuild()
+
+
+class Snapshot(object):
+    """mmap打开的只读快照"""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.prefix_count = _HEADER.unpack_from(self._data, 0)
+        self.prefix_base = _HEADER.size + _ENTRY.size * self.count
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('搜索提示快照格式错误：{}'.format(path))
+
+    def entry(self, i):
+        return _ENTRY.unpack_from(self._data, _HEADER.size + i * _ENTRY.size)
+
+    def key(self, i):
+        key_offset, key_len = _ENTRY.unpack_from(self._data, _HEADER.size + i * _ENTRY.size)[:2]
+        return self._data[key_offset:key_offset + key_len]
+
+    def text(self, entry):
+        return self._data[entry[2]:entry[2] + entry[3]].decode('utf8')
+
+    def lower_bound(self, prefix):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find_prefix(self, prefix):
+        """在预先计算的前缀数组中二分查找，:return: 条目序号列表"""
+        lo, hi = 0, self.prefix_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, top_offset, top_len = _PREFIX.unpack_from(self._data, self.prefix_base + mid * _PREFIX.size)
+            key = self._data[offset:offset + length]
+            if key == prefix:
+                return struct.unpack_from('<{}I'.format(top_len), self._data, top_offset)
+            if key < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return ()
+
+    def scan(self, prefix, count):
+        """二分查找前缀起点后顺序扫描，:return: 条目序号列表"""
+        candidates = []
+        i = self.lower_bound(prefix)
+        end = min(self.count, i + constants.SUGGEST_SCAN_LIMIT)
+        while i < end and self.key(i).startswith(prefix):
+            candidates.append((self.entry(i)[4], -i))
+            i += 1
+        result = []
+        seen = set()
+        for _, neg_i in heapq.nlargest(len(candidates), candidates):
+            entry = self.entry(-neg_i)
+            if (entry[6], entry[5]) in seen:
+                continue
+            seen.add((entry[6], entry[5]))
+            result.append(-neg_i)
+            if len(result) >= count:
+                break
+        return result
+
+    def search(self, prefix, count):
+        """
+        :param prefix: 归一化后的前缀
+        :return: 前缀范围内分数最高的count条，同一新闻或标签只出现一次
+        """
+        prefix_bytes = prefix.encode('utf8')
+        indexes = self.find_prefix(prefix_bytes)[:count] or self.scan(prefix_bytes, count)
+        results = []
+        for i in indexes:
+            entry = self.entry(i)
+            results.append({'text': self.text(entry), 'type': TYPE_NAMES[entry[6]], 'id': entry[5]})
+        return results
+
+    def close(self):
+        self._data.close()
+
+
+class SnapshotHolder(object):
+    """
+    进程内持有快照，最多每 SUGGEST_CHECK_INTERVAL 秒检查一次文件是否被替换
+    """
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self.snapshot = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self.snapshot is not None and now - self.checked_at < constants.SUGGEST_CHECK_INTERVAL:
+            return self.snapshot
+        with self.lock:
+            self.checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                # 快照由 rebuild_search_suggest 生成，请求中不从数据库重建
+                return self.snapshot
+            current = self.snapshot
+            if current is None or (stat.st_ino, stat.st_mtime_ns) != (current.stat.st_ino, current.stat.st_mtime_ns):
+                # 旧快照不主动关闭，其他线程可能仍在读取，随对象回收释放
+                self.snapshot = Snapshot(self.path)
+        return self.snapshot
+
+
+holder = SnapshotHolder()
+
+
+def suggest(text, count=constants.SUGGEST_COUNT):
+    prefix = normalize_prefix(text)
+    if not prefix:
+        return []
+    snapshot = holder.get()
+    if snapshot is None:
+        return []
+    return snapshot.search(prefix, min(count, constants.SUGGEST_COUNT))
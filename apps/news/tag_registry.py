@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import threading
+import time
+
+from news import constants
+
+
+class TagRegistry(object):
+    """
+    进程内缓存的有效标签（未逻辑删除的Tag）id到名称的映射
+    Tag保存或删除时由信号清空，另设过期时间兜底其他进程中的修改
+    """
+    def __init__(self, timeout=constants.TAG_REGISTRY_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._tags = None
+        self._loaded_at = 0
+
+    def _load(self):
+        from news.models import Tag
+        return dict(Tag.objects.filter(is_delete=False).values_list('id', 'name'))
+
+    def tags(self):
+        """:return: {标签id: 标签名}"""
+        tags = self._tags
+        if tags is not None and time.monotonic() - self._loaded_at < self.timeout:
+            return tags
+        with self._lock:
+            if self._tags is None or time.monotonic() - self._loaded_at >= self.timeout:
+                self._tags = self._load()
+                self._loaded_at = time.monotonic()
+            return self._tags
+
+    def tag_ids(self):
+        return self.tags().keys()
+
+    def is_valid(self, tag_id):
+        return bool(tag_id) and tag_id in self.tag_ids()
+
+    def invalidate(self):
+        with self._lock:
+            self._tags = None
+
+
+tag_registry = TagRegistry()
@@ -1,3 +1,141 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from haystack import connections
+from haystack.constants import ID
+from haystack.query import SearchQuerySet
+
+from news import index_rebuild
+from news import search_cache
+from news import search_queue
+from news.models import News, Tag
+from config.localsearch import store
+from users.models import Users
+
+SEARCH_PATH = tempfile.mkdtemp()
+
+
+@override_settings(
+    CACHES=dict(settings.CACHES, default={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}),
+    HAYSTACK_CONNECTIONS=dict(settings.HAYSTACK_CONNECTIONS, local={
+        'ENGINE': 'config.localsearch.backend.LocalSearchEngine',
+        'PATH': SEARCH_PATH,
+    }),
+)
+class SearchQueueRemoveTest(TestCase):
+    """队列中的删除任务要能删掉索引中的文档"""
+    using = 'local'
+
+    def setUp(self):
+        connections.reload(self.using)
+        tag = Tag.objects.create(id=1, name='测试')
+        author = Users.objects.create_user(username='tester', password='password', mobile='13800000000')
+        self.news = News.objects.create(title='python教程', digest='python', content='python入门', tag=tag,
+                                        author=author)
+        search_queue.process([('news.news', self.news.pk, search_queue.ACTION_UPDATE)], self.using)
+
+    def tearDown(self):
+        shutil.rmtree(SEARCH_PATH, ignore_errors=True)
+        connections.reload(self.using)
+
+    def search(self):
+        return list(SearchQuerySet(using=self.using).auto_query('python'))
+
+    def test_document_id(self):
+        # ES用 prepared[ID] 作为 _id，要与删除时拼出的标识一致
+        index = connections[self.using].get_unified_index().get_index(News)
+        self.assertEqual(index.full_prepare(self.news)[ID], search_queue.get_identifier_by_pk(News, self.news.pk))
+
+    def test_indexed(self):
+        results = self.search()
+        self.assertEqual([r.news_id for r in results], [self.news.pk])
+
+    def test_soft_delete(self):
+        self.news.is_delete = True
+        self.news.save()
+        updated, removed = search_queue.process(
+            [('news.news', self.news.pk, search_queue.ACTION_UPDATE)], self.using)
+        self.assertEqual((updated, removed), (0, 1))
+        self.assertEqual(self.search(), [])
+
+    def test_delete(self):
+        pk = self.news.pk
+        self.news.delete()
+        search_queue.process([('news.news', pk, search_queue.ACTION_DELETE)], self.using)
+        self.assertEqual(self.search(), [])
+
+    def test_update_chunk_soft_delete(self):
+        # 增量重建的水位线扫描同样要能删除
+        since = self.news.update_time
+        self.news.is_delete = True
+        self.news.save()
+        updated, removed = index_rebuild._update_chunk((self.using, self.news.pk, self.news.pk + 1, since))
+        self.assertEqual((updated, removed), (0, 1))
+        self.assertEqual(self.search(), [])
+
+    def test_update_after_merge(self):
+        connections[self.using].get_backend().merge()
+        News.objects.filter(pk=self.news.pk).update(title='python进阶')
+        search_queue.process([('news.news', self.news.pk, search_queue.ACTION_UPDATE)], self.using)
+        results = self.search()
+        self.assertEqual([(r.news_id, r.title) for r in results], [(self.news.pk, 'python进阶')])
+
+    def test_rebuild_replays_delta(self):
+        # 重建期间写入旧段的增量在切换时重放到新段
+        backend = connections[self.using].get_backend()
+        index = connections[self.using].get_unified_index().get_index(News)
+        store.begin_rebuild(backend.path)
+        op = backend.prepare_document(index, self.news)
+        name = store.write_segment(backend.path, [(op['id'], op['terms'], op['length'], op['stored'])])
+        other = News.objects.create(title='python进阶', digest='python', content='python进阶', tag=self.news.tag)
+        search_queue.process([('news.news', other.pk, search_queue.ACTION_UPDATE)], self.using)
+        pk = self.news.pk
+        self.news.delete()
+        search_queue.process([('news.news', pk, search_queue.ACTION_DELETE)], self.using)
+        store.finish_rebuild(backend.path, name)
+        self.assertEqual([r.news_id for r in self.search()], [other.pk])
+
+
+@override_settings(
+    CACHES=dict(settings.CACHES, default={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}),
+    HAYSTACK_CONNECTIONS=dict(settings.HAYSTACK_CONNECTIONS, default={
+        'ENGINE': 'config.localsearch.backend.LocalSearchEngine',
+        'PATH': SEARCH_PATH,
+    }),
+)
+class SearchViewTest(TestCase):
+    """搜索页用本地索引渲染"""
+
+    def setUp(self):
+        # haystack 在导入时读取连接配置，这里换成覆盖后的配置
+        self.connections_info = connections.connections_info
+        connections.connections_info = settings.HAYSTACK_CONNECTIONS
+        connections.reload('default')
+        tag = Tag.objects.create(id=1, name='测试')
+        self.news = News.objects.create(title='python教程', digest='python', content='python入门', tag=tag)
+        search_queue.process([('news.news', self.news.pk, search_queue.ACTION_UPDATE)])
+
+    def tearDown(self):
+        shutil.rmtree(SEARCH_PATH, ignore_errors=True)
+        connections.connections_info = self.connections_info
+        connections.reload('default')
+
+    def test_search(self):
+        response = self.client.get(reverse('news:search'), {'q': 'Python'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('news:news_detail', args=[self.news.pk]))
+        # 页面显示用户输入的查询词，缓存键用归一化后的
+        self.assertEqual(response.context['query'], 'Python')
+
+    def test_cache_write_error(self):
+        cache = mock.Mock()
+        cache.get.return_value = None
+        cache.set.side_effect = ConnectionError
+        with mock.patch.object(search_cache, 'get_cache', return_value=cache):
+            response = self.client.get(reverse('news:search'), {'q': 'python'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('news:news_detail', args=[self.news.pk]))
@@ -27,4 +27,5 @@ urlpatterns = [
     path('news/<int:news_id>/', views.NewsDetailView.as_view(), name='news_detail'),
     path('news/<int:news_id>/comments/', views.NewsCommentView.as_view(), name='news_comment'),
     path('search/', views.SearchView(), name='search'),
+    path('search/suggest/', views.SearchSuggestView.as_view(), name='search_suggest'),
 ]
@@ -1,18 +1,32 @@
 from django.shortcuts import render
 from django.views import View
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger, InvalidPage
 from time import strftime
 from django.http import Http404
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 from mysite import settings
 from haystack.views import SearchView as _SearchView
 
 from news import models
 from news import constants
+from news.tag_registry import tag_registry
+from news import list_cache
+from news import clicks
+from news import rankings
+from news import comment_tree
+from news import serializers
+from news import search_cache
+from news import suggest
 from config.json_fun import to_json_data
+from config import cursor_paginator
+from config import conditional
 from config.res_code import Code, error_map
 
 
+import datetime
 import logging
 import json
 # Create your views here.
@@ -31,12 +45,8 @@ class IndexView(View):
         # 数据库查询tag
         tags = models.Tag.objects.only('id', 'name').filter(is_delete=False)
 
-        # 数据库查询热门新闻
-        hot_news = models.HotNews.objects.select_related('news').only(
-            'news__title', 'news__image_url', 'news_id'
-        ).filter(is_delete=False).order_by(
-            'priority','-news__clicks'
-        )[:constants.SHOW_HOTNEWS_COUNT]
+        # 热门新闻从排行缓存读取
+        hot_news = rankings.get_ranking(rankings.HOTNEWS, constants.SHOW_HOTNEWS_COUNT)
         # tags = models.Tag.objects.defer('id', 'name').filter(is_delete=False) # 排除
         # context = {
         #     'tags': tags,
@@ -45,7 +55,10 @@ class IndexView(View):
 
 
 class NewListView(View):
-    """"""
+    """
+    /news/
+    传入page时按页码分页（前端默认方式），传入cursor时按游标分页
+    """
     def get(self, request):
         # 1获取参数
         # 2校验参数
@@ -54,70 +67,95 @@ class NewListView(View):
         except Exception as e:
             logger.error('标签错误：\n{}'.format(e))
             tag_id = 0
+        # 标签无效时返回全部新闻（不对查询集求值）
+        if not tag_registry.is_valid(tag_id):
+            tag_id = 0
+
+        if 'cursor' in request.GET:
+            cursor = request.GET.get('cursor', '')
+            params = (tag_id, 'cursor', cursor)
+            builder = lambda: self.get_cursor_data(tag_id, cursor)
+        else:
+            try:
+                page = int(request.GET.get('page', 1))
+            except Exception as e:
+                logger.error('页面错误：\n{}'.format(e))
+                page = 1
+            params = (tag_id, 'page', page)
+            builder = lambda: self.get_page_data(tag_id, page)
 
+        # 3缓存代数未变时直接返回304
         try:
-            page = int(request.GET.get('page', 1))
+            generation = list_cache.get_generation()
         except Exception as e:
-            logger.error('页面错误：\n{}'.format(e))
-            page =1
-
-        # 3数据库获取数据
-        # title、digest、image_url、update_time
-        # select_related
-        news_queryset = models.News.objects.select_related('tag', 'author').only(
-            'title', 'digest', 'image_url','update_time', 'tag__name', 'author__username')
-        news = news_queryset.filter(is_delete=False, tag_id=tag_id) or news_queryset.filter(is_delete=False)
-
-        # 4分页
-        paginator = Paginator(news, constants.PER_PAGE_NEWS_COUNT)
+            logger.error('新闻列表缓存代数读取失败：\n{}'.format(e))
+            generation = None
+        etag = conditional.make_etag('news', generation, *params) if generation else None
+        response = conditional.not_modified(request, etag=etag)
+        if response:
+            return response
+
+        # 4读取缓存，未命中时查询数据库并分页
+        try:
+            data = list_cache.get_or_build('news', params, builder, generation)
+        except cursor_paginator.InvalidCursor as e:
+            logger.info('游标错误：\n{}'.format(e))
+            return to_json_data(errno=Code.PARAMERR, errmsg=error_map[Code.PARAMERR])
+        # 5返回数据到前端
+        return conditional.set_validators(to_json_data(data=data), etag=etag)
+
+    @staticmethod
+    def get_queryset(tag_id):
+        # 只取需要的列，直接返回元组，不创建模型实例
+        news_queryset = models.News.objects.values_list(*serializers.NEWS_LIST_FIELDS)
+        if tag_id:
+            return news_queryset.filter(is_delete=False, tag_id=tag_id)
+        return news_queryset.filter(is_delete=False)
+
+    def get_page_data(self, tag_id, page):
+        """
+        页码分页
+        """
+        paginator = Paginator(self.get_queryset(tag_id), constants.PER_PAGE_NEWS_COUNT)
         try:
             news_info = paginator.page(page)
         except Exception:
             logger.error('访问页面失败')
             news_info = paginator.page(paginator.num_pages)
-        # 5序列化输出
-        news_info_list = []
-        for n in news_info:
-            news_info_list.append({
-                'id': n.id,
-                'title': n.title,
-                'digest': n.digest,
-                'image_url': n.image_url,
-                'update_time': n.update_time.strftime('%Y年%m月%d日 %H:%M'),
-                'tag_name': n.tag.name,
-                'author': n.author.username
-                })
-        data = {
-            'news': news_info_list,
+        # 序列化输出
+        return {
+            'news': serializers.news_list_data(news_info),
             'total_pages': paginator.num_pages
         }
-        # 6返回数据到前端
-        return to_json_data(data=data)
+
+    def get_cursor_data(self, tag_id, cursor):
+        """
+        游标分页：按 (update_time, id) 定位，不查询总数，深翻页与第一页开销一致
+        """
+        news_info, next_cursor = cursor_paginator.get_cursor_page(
+            self.get_queryset(tag_id), cursor, constants.PER_PAGE_NEWS_COUNT, key=serializers.news_list_key)
+        return {
+            'news': serializers.news_list_data(news_info),
+            'next_cursor': next_cursor
+        }
 
 
 class NewsBanner(View):
-    """"""
+    """
+    /news/banners/
+    """
     def get(self, request):
-        banners = models.Banner.objects.select_related('news').only(
-            'image_url', 'news_id', 'news__title'
-        ).filter(is_delete=False).order_by(
-            'priority', '-news__clicks'
-        )[:constants.SHOW_BANNER_COUNT]
-
-        # 序列化输出
-        banners_info_list = []
-        for b in banners:
-            banners_info_list.append(
-                {
-                    'image_url': b.image_url,
-                    'news_id': b.news_id,
-                    'news_title': b.news.title
-                }
-            )
+        # 排行未重建时直接返回304
+        version = rankings.get_version(rankings.BANNERS)
+        etag = conditional.make_etag('banners', version) if version else None
+        response = conditional.not_modified(request, etag=etag)
+        if response:
+            return response
+        # 轮播图从排行缓存读取
         data = {
-            'banners': banners_info_list
+            'banners': rankings.get_ranking(rankings.BANNERS, constants.SHOW_BANNER_COUNT)
         }
-        return to_json_data(data=data)
+        return conditional.set_validators(to_json_data(data=data), etag=etag)
 
 
 class NewsDetailView(View):
@@ -126,29 +164,63 @@ class NewsDetailView(View):
 
     """
     def get(self, request, news_id):
+        # 一次聚合查询得到新闻和评论的最后修改时间、评论数，未变化时直接返回304
+        stamp = models.News.objects.filter(is_delete=False, id=news_id).annotate(
+            comments_update_time=Max('comments__update_time'), comments_count=Count('comments')
+        ).values('update_time', 'comments_update_time', 'comments_count').first()
+        if not stamp:
+            raise Http404('新闻{}不存在'.format(news_id))
+        # 点击量先记录在redis中，定期批量写回数据库
+        clicks.incr(news_id)
+        last_modified = max(t for t in (stamp['update_time'], stamp['comments_update_time']) if t)
+        try:
+            generation = list_cache.get_generation()
+        except Exception as e:
+            logger.error('新闻列表缓存代数读取失败：\n{}'.format(e))
+            generation = None
+        # 页面内容与登录状态有关，标签名等关联数据的变化由缓存代数体现
+        etag = conditional.make_etag(
+            'news_detail', news_id, last_modified.isoformat(), stamp['comments_count'],
+            generation, request.user.id
+        ) if generation else None
+        response = conditional.not_modified(request, etag=etag, last_modified=last_modified)
+        if response:
+            return response
+
         # 数据库查询
         news = models.News.objects.select_related('tag', 'author').only(
             'title', 'content', 'update_time', 'tag__name', 'author__username'
         ).filter(is_delete=False, id=news_id).first()
         if news:
-            # content, update_time, patent, username, parent.content, update_time
-            comments = models.Comments.objects.select_related('author', 'parent').only(
-                'content', 'update_time', 'author__username', 'parent__content',
-                'parent__author__username', 'parent__update_time'
-            ).filter(is_delete=False, news_id=news_id)
-            comments_list = []
-            # 拿出每一个评论
-            for comm in comments:
-                comments_list.append(comm.to_dict_data())
-            return render(request, 'news/news_detail.html', locals())
+            # 只渲染第一页评论，其余由前端滚动时通过 /news/<id>/comments/ 加载
+            comments_list, next_cursor = comment_tree.get_comments_page(
+                news_id, '', constants.PER_PAGE_COMMENTS_COUNT)
+            response = render(request, 'news/news_detail.html', locals())
+            return conditional.set_validators(response, etag=etag, last_modified=last_modified)
         else:
-            return Http404('新闻{}不存在'.format('news_id'))
+            raise Http404('新闻{}不存在'.format(news_id))
 
 
 class NewsCommentView(View):
     """
     /news/<int:news_id>/comments/
     """
+    def get(self, request, news_id):
+        """
+        评论列表，按游标分页
+        """
+        try:
+            comments_list, next_cursor = comment_tree.get_comments_page(
+                news_id, request.GET.get('cursor', ''), constants.PER_PAGE_COMMENTS_COUNT)
+        except cursor_paginator.InvalidCursor as e:
+            logger.info('游标错误：\n{}'.format(e))
+            return to_json_data(errno=Code.PARAMERR, errmsg=error_map[Code.PARAMERR])
+        data = {
+            'comments': comments_list,
+            'next_cursor': next_cursor
+        }
+        return to_json_data(data=data)
+
     def post(self, request, news_id):
         # 1获取参数
         # 是否登录
@@ -190,18 +262,162 @@ class NewsCommentView(View):
         return to_json_data(data=news_comment.to_dict_data())
 
 
+class SearchSuggestView(View):
+    """
+    /search/suggest/?q=
+    搜索框输入提示，从共享的前缀快照中查询，不访问数据库和搜索后端
+    """
+    def get(self, request):
+        data = {
+            'suggestions': suggest.suggest(request.GET.get('q', ''))
+        }
+        return to_json_data(data=data)
+
+
+def start_of_day(date):
+    """本地时区当天0点"""
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+class CachedResults(object):
+    """
+    只包含一页数据的结果序列，长度为命中总数，供Paginator分页
+    """
+    def __init__(self, hits, offset, results):
+        self.hits = hits
+        self.offset = offset
+        self.results = results
+
+    def __len__(self):
+        return self.hits
+
+    def __getitem__(self, item):
+        start = (item.start or 0) - self.offset
+        stop = item.stop - self.offset if item.stop is not None else None
+        return self.results[max(start, 0):stop]
+
+
 class SearchView(_SearchView):
     # 模版文件
     template = 'news/search.html'
+    # 需要从数据库补充的News字段，默认为空：只用索引中存储的字段渲染，不查询数据库
+    hydrate_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        # 不使用load_all，避免每页批量查询数据库
+        kwargs.setdefault('load_all', False)
+        super(SearchView, self).__init__(*args, **kwargs)
+
+    def get_query(self):
+        """
+        self.query 保留用户输入，用于页面显示；归一化后的查询词另存，
+        既交给搜索后端也作为缓存键，归一化结果相同的写法（全角、大小写、空白）得到相同的结果
+        """
+        query = super(SearchView, self).get_query()
+        self.normalized_query = search_cache.normalize_query(query)
+        return query
+
+    def get_filters(self):
+        """
+        标签、更新日期范围过滤条件，日期格式为 YYYY-MM-DD，无效的条件忽略
+        :return: (tag_id, start_date, end_date)
+        """
+        try:
+            tag_id = int(self.request.GET.get('tag_id', 0))
+        except (TypeError, ValueError):
+            tag_id = 0
+        if not tag_registry.is_valid(tag_id):
+            tag_id = None
+        dates = []
+        for name in ('start_date', 'end_date'):
+            try:
+                dates.append(parse_date(self.request.GET.get(name, '')))
+            except ValueError:
+                dates.append(None)
+        return (tag_id,) + tuple(dates)
+
+    def get_results(self):
+        """
+        过滤条件和按标签的分面统计都交给搜索后端，与查询一起执行
+        """
+        self.filters = self.get_filters()
+        tag_id, start_date, end_date = self.filters
+        # 与 SearchForm.search() 相同，只是用归一化后的查询词，不修改表单的 cleaned_data
+        if not self.normalized_query:
+            return self.form.no_query_found()
+        results = self.form.searchqueryset.auto_query(self.normalized_query)
+        if hasattr(self.form, 'get_models'):
+            results = results.models(*self.form.get_models())
+        if tag_id:
+            results = results.filter(tag_id=tag_id)
+        if start_date:
+            results = results.filter(update_time__gte=start_of_day(start_date))
+        if end_date:
+            results = results.filter(update_time__lt=start_of_day(end_date + datetime.timedelta(days=1)))
+        return results.facet('tag_id')
+
+    def build_page(self):
+        """
+        按 (归一化查询词, 过滤条件, 页码) 读取缓存，未命中时只查询当前页
+        """
+        try:
+            page_no = int(self.request.GET.get('page', 1))
+        except (TypeError, ValueError):
+            raise Http404('页码错误')
+        if page_no < 1:
+            raise Http404('页码错误')
+
+        start_offset = (page_no - 1) * self.results_per_page
+        hits, results, self.facets = search_cache.get_or_build(
+            self.normalized_query, page_no, lambda: self.fetch_page(start_offset), self.filters)
+
+        paginator = Paginator(CachedResults(hits, start_offset, results), self.results_per_page)
+        try:
+            page = paginator.page(page_no)
+        except InvalidPage:
+            raise Http404('页码错误')
+        if self.hydrate_fields:
+            self.hydrate(page.object_list)
+        return paginator, page
+
+    def fetch_page(self, start_offset):
+        """
+        :return: (命中总数, 当前页结果, [(标签id, 数量), ...])
+        """
+        results = list(self.results[start_offset:start_offset + self.results_per_page])
+        facets = self.results.facet_counts().get('fields', {}).get('tag_id', [])
+        return self.results.count(), results, [(int(tag_id), count) for tag_id, count in facets if tag_id]
+
+    def extra_context(self):
+        tags = tag_registry.tags()
+        tag_id, start_date, end_date = self.filters
+        # 分页、分面链接中需要保留的过滤参数
+        date_params = ''.join('&{}={}'.format(name, value.isoformat())
+                              for name, value in (('start_date', start_date), ('end_date', end_date)) if value)
+        return {
+            'tag_facets': [{'id': i, 'name': tags[i], 'count': count}
+                           for i, count in getattr(self, 'facets', ()) if i in tags],
+            'tag_id': tag_id,
+            'start_date': start_date,
+            'end_date': end_date,
+            'date_params': date_params,
+            'filter_params': '&tag_id={}{}'.format(tag_id, date_params) if tag_id else date_params,
+        }
+
+    def hydrate(self, results):
+        """
+        当前页的新闻一次查询，只取hydrate_fields，结果挂到 SearchResult.object 上
+        """
+        objects = models.News.objects.only(*self.hydrate_fields).in_bulk([int(r.pk) for r in results])
+        for result in results:
+            result._object = objects.get(int(result.pk))
 
     # 重写响应方式，如果请求参数q为空，返回模型News的热门新闻数据，否则根据参数q搜索相关数据
     def create_response(self):
         kw = self.request.GET.get('q', '')
         if not kw:
             show_all = True
-            hot_news = models.HotNews.objects.select_related('news').only(
-                'news__title', 'news__image_url', 'news__id'
-            ).filter(is_delete=False).order_by('priority', '-news__clicks')
+            hot_news = rankings.get_ranking(rankings.HOTNEWS)
 
             paginator = Paginator(hot_news, settings.HAYSTACK_SEARCH_RESULTS_PER_PAGE)
             try:
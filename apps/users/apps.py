@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class UsersConfig(AppConfig):
-    name = 'apps.users'
+    name = 'users'
+
+    def ready(self):
+        # 注册信号处理函数
+        from users import signals
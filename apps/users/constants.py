@@ -1,4 +1,13 @@
 #!/usr/bin/env python
 # encoding: utf-8
 # 用户session过期时间，单位秒，设置为五天
-USER_SESSION_EXPIRES = 5 * 24 * 60 * 60
\ No newline at end of file
+USER_SESSION_EXPIRES = 5 * 24 * 60 * 60
+
+# 重建用户存在性索引时每次写入redis的数量
+EXISTS_INDEX_BATCH_SIZE = 1000
+
+# 重建用户存在性索引时，重建标记的有效期，秒
+EXISTS_INDEX_REBUILDING_EXPIRES = 60 * 60
+
+# 重建后按注册时间补录用户时，向前多取的时间，秒；覆盖开始重建前插入、扫描后才提交的事务
+EXISTS_INDEX_REBUILD_MARGIN = 5 * 60
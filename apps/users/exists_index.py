@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+用户名、手机号的存在性索引
+所有用户名（转小写）、手机号分别保存在redis集合中，注册页的检查先查集合：
+不在集合中直接返回不存在，在集合中再查数据库确认（集合可能残留改名、回滚留下的旧值）
+索引由 Users 的 post_save / post_delete 信号维护，可用 rebuild_users_exists_index 命令全量重建；
+未建好索引或redis出错时直接查数据库
+"""
+import logging
+from datetime import timedelta
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from users import constants
+from users.models import Users
+
+logger = logging.getLogger('django')
+
+USERNAME_KEY = 'users_username_index'
+MOBILE_KEY = 'users_mobile_index'
+# 全量重建完成后设置，此前集合可能不完整，不能用来判断不存在
+READY_KEY = 'users_exists_index_ready'
+# 重建期间存在，信号同时写入临时集合，替换时不会丢失重建期间注册的用户
+REBUILDING_KEY = 'users_exists_index_rebuilding'
+USERNAME_TMP_KEY = USERNAME_KEY + '_tmp'
+MOBILE_TMP_KEY = MOBILE_KEY + '_tmp'
+
+# KEYS: 用户名集合, 手机号集合, 重建标记, 用户名临时集合, 手机号临时集合
+# ARGV: 用户名, 手机号，为空字符串时不写入
+# 与重建时的替换都在redis中原子执行，写入要么在替换前进入临时集合，要么在替换后进入新集合
+_ADD = """
+local rebuilding = redis.call('EXISTS', KEYS[3]) == 1
+if ARGV[1] ~= '' then
+    redis.call('SADD', KEYS[1], ARGV[1])
+    if rebuilding then
+        redis.call('SADD', KEYS[4], ARGV[1])
+    end
+end
+if ARGV[2] ~= '' then
+    redis.call('SADD', KEYS[2], ARGV[2])
+    if rebuilding then
+        redis.call('SADD', KEYS[5], ARGV[2])
+    end
+end
+"""
+
+# KEYS: 用户名集合, 手机号集合, 重建标记, 用户名临时集合, 手机号临时集合, READY
+# 临时集合为空时redis不会创建它，不能RENAME
+_SWAP = """
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[6])
+if redis.call('EXISTS', KEYS[4]) == 1 then
+    redis.call('RENAME', KEYS[4], KEYS[1])
+end
+if redis.call('EXISTS', KEYS[5]) == 1 then
+    redis.call('RENAME', KEYS[5], KEYS[2])
+end
+"""
+
+_scripts = {}
+
+
+def get_connection():
+    return get_redis_connection(alias='default')
+
+
+def username_member(username):
+    # MySQL默认的排序规则不区分大小写，集合中统一保存小写，避免把已存在的用户名判断为不存在
+    return username.lower()
+
+
+def _run(name, source, keys, args=()):
+    con = get_connection()
+    script = _scripts.get(name)
+    if script is None:
+        script = _scripts[name] = con.register_script(source)
+    return script(keys=keys, args=args, client=con)
+
+
+def add(username, mobile):
+    _run('add', _ADD, [USERNAME_KEY, MOBILE_KEY, REBUILDING_KEY, USERNAME_TMP_KEY, MOBILE_TMP_KEY],
+         [username_member(username) if username else '', mobile or ''])
+
+
+def remove(username, mobile):
+    pipe = get_connection().pipeline(transaction=False)
+    if username:
+        pipe.srem(USERNAME_KEY, username_member(username))
+    if mobile:
+        pipe.srem(MOBILE_KEY, mobile)
+    pipe.execute()
+
+
+def _add_rows(con, rows, username_key, mobile_key, batch_size):
+    count = 0
+    usernames = []
+    mobiles = []
+    for username, mobile in rows:
+        usernames.append(username_member(username))
+        if mobile:
+            mobiles.append(mobile)
+        count += 1
+        if len(usernames) >= batch_size:
+            con.sadd(username_key, *usernames)
+            if mobiles:
+                con.sadd(mobile_key, *mobiles)
+            usernames = []
+            mobiles = []
+    if usernames:
+        con.sadd(username_key, *usernames)
+    if mobiles:
+        con.sadd(mobile_key, *mobiles)
+    return count
+
+
+def rebuild(batch_size=constants.EXISTS_INDEX_BATCH_SIZE):
+    """
+    写入临时集合后原子替换，重建期间信号同时写入临时集合；
+    开始前已插入、扫描后才提交的用户不在扫描结果中，替换后按注册时间补上，补完才设置READY
+    :return: 扫描到的用户数
+    """
+    con = get_connection()
+    started = timezone.now()
+    con.delete(USERNAME_TMP_KEY, MOBILE_TMP_KEY)
+    con.set(REBUILDING_KEY, 1, ex=constants.EXISTS_INDEX_REBUILDING_EXPIRES)
+    rows = Users.objects.values_list('username', 'mobile').iterator()
+    count = _add_rows(con, rows, USERNAME_TMP_KEY, MOBILE_TMP_KEY, batch_size)
+
+    _run('swap', _SWAP, [USERNAME_KEY, MOBILE_KEY, REBUILDING_KEY, USERNAME_TMP_KEY, MOBILE_TMP_KEY, READY_KEY])
+
+    since = started - timedelta(seconds=constants.EXISTS_INDEX_REBUILD_MARGIN)
+    rows = Users.objects.filter(date_joined__gte=since).values_list('username', 'mobile').iterator()
+    _add_rows(con, rows, USERNAME_KEY, MOBILE_KEY, batch_size)
+    con.set(READY_KEY, 1)
+    return count
+
+
+def _exists(key, member, **lookup):
+    try:
+        pipe = get_connection().pipeline(transaction=False)
+        pipe.exists(READY_KEY)
+        pipe.sismember(key, member)
+        ready, found = pipe.execute()
+        if ready and not found:
+            return False
+    except Exception as e:
+        logger.error('用户存在性索引读取失败：\n{}'.format(e))
+    return Users.objects.filter(**lookup).exists()
+
+
+def username_exists(username):
+    return _exists(USERNAME_KEY, username_member(username), username=username)
+
+
+def mobile_exists(mobile):
+    return _exists(MOBILE_KEY, mobile, mobile=mobile)
@@ -1,15 +1,19 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import logging
 import re
 
 from django import forms
-from django_redis import get_redis_connection
 from django.db.models import Q
 from django.contrib.auth import login, logout
 
 from verifications.constants import SMS_CODE_NUMS
+from verifications import code_store
 from .models import Users
 from users import constants
+from users import exists_index
+
+logger = logging.getLogger('django')
 
 class RegisterForm(forms.Form):
     """
@@ -41,7 +45,7 @@ class RegisterForm(forms.Form):
         if not re.match(r"^1[3-9]\d{9}$", tel):
             raise forms.ValidationError("手机号码格式不正确")
 
-        if Users.objects.filter(mobile=tel).exists():
+        if exists_index.mobile_exists(tel):
             raise forms.ValidationError("手机号已注册，请重新输入！")
 
         return tel
@@ -59,16 +63,18 @@ class RegisterForm(forms.Form):
 
         tel = cleaned_data.get('mobile')
         sms_text = cleaned_data.get('sms_code')
-
-        # 建立redis连接
-        redis_conn = get_redis_connection(alias='verify_codes')
-
-        sms_fmt = "sms_{}".format(tel)
-
-        real_sms = redis_conn.get(sms_fmt)
-
-        if (not real_sms) or (sms_text != real_sms.decode('utf-8')):
+        if self.errors:
+            return cleaned_data
+
+        # 这里只比对不删除，用户创建成功后由视图删除，避免注册失败时验证码已被用掉
+        try:
+            valid = code_store.check_sms_code(tel, sms_text)
+        except Exception as e:
+            logger.error('redis执行异常：\n{}'.format(e))
+            raise forms.ValidationError('服务器繁忙，请稍后重试')
+        if not valid:
             raise forms.ValidationError("短信验证码错误")
+        return cleaned_data
 
 
 class LoginForm(forms.Form):
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from django.core.management.base import BaseCommand
+
+from users import constants
+from users import exists_index
+
+
+class Command(BaseCommand):
+    help = '从数据库重建用户名、手机号的存在性索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=constants.EXISTS_INDEX_BATCH_SIZE,
+                            help='每次写入redis的数量')
+
+    def handle(self, *args, **options):
+        count = exists_index.rebuild(options['batch_size'])
+        self.stdout.write('用户存在性索引已重建：{}个用户'.format(count))
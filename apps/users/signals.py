@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users import exists_index
+from users.models import Users
+
+logger = logging.getLogger('django')
+
+
+@receiver(post_save, sender=Users)
+def add_to_exists_index(sender, instance, **kwargs):
+    """
+    保存后立即加入存在性索引，事务回滚留下的多余值在查询时由数据库确认
+    改名后旧用户名仍留在集合中，同样由数据库确认
+    """
+    try:
+        exists_index.add(instance.username, instance.mobile)
+    except Exception as e:
+        logger.error('用户存在性索引更新失败：\n{}'.format(e))
+
+
+@receiver(post_delete, sender=Users)
+def remove_from_exists_index(sender, instance, **kwargs):
+    """事务提交后才移除，否则回滚后会把存在的用户判断为不存在"""
+    def remove():
+        try:
+            exists_index.remove(instance.username, instance.mobile)
+        except Exception as e:
+            logger.error('用户存在性索引更新失败：\n{}'.format(e))
+    transaction.on_commit(remove)
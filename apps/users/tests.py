@@ -1,3 +1,32 @@
+import json
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+
+from config.res_code import Code
+from users.models import Users
+from verifications import code_store
+
+
+@mock.patch.object(code_store, 'check_sms_code', return_value=True)
+class RegisterViewTest(TestCase):
+    """短信验证码在用户创建后删除，删除失败时回滚"""
+    data = {'username': 'tester', 'password': 'password', 'password_repeat': 'password',
+            'mobile': '13800000000', 'sms_code': '123456'}
+
+    def post(self):
+        response = self.client.post(reverse('users:register'), json.dumps(self.data), content_type='application/json')
+        return json.loads(response.content.decode('utf8'))
+
+    def test_redis_error(self, check_sms_code):
+        with mock.patch.object(code_store, 'consume_sms_code', side_effect=ConnectionError):
+            result = self.post()
+        self.assertEqual(result['errno'], Code.UNKOWNERR)
+        self.assertFalse(Users.objects.filter(username='tester').exists())
 
-# Create your tests here.
+    def test_code_already_used(self, check_sms_code):
+        with mock.patch.object(code_store, 'consume_sms_code', return_value=False):
+            result = self.post()
+        self.assertEqual(result['errno'], Code.PARAMERR)
+        self.assertFalse(Users.objects.filter(username='tester').exists())
@@ -1,14 +1,19 @@
+import logging
+
 from django.shortcuts import render, redirect, reverse
 from django.views import View
 
 from django.contrib.auth import login, logout
+from django.db import transaction
 
 from users.forms import RegisterForm, LoginForm
 from users.models import Users
 from config.json_fun import to_json_data
 from config.res_code import Code, error_map
+from verifications import code_store
 import json
 
+logger = logging.getLogger('django')
 
 # Create your views here.
 
@@ -34,8 +39,22 @@ class RegisterView(View):
             usename = form.cleaned_data.get('username')
             password = form.cleaned_data.get('password')
             mobile = form.cleaned_data.get('mobile')
-
-            user = Users.objects.create_user(username=usename, password=password, mobile=mobile)
+            sms_code = form.cleaned_data.get('sms_code')
+
+            # 用户创建成功后才删除短信验证码，验证码已被并发的请求用掉或redis出错时回滚
+            with transaction.atomic():
+                user = Users.objects.create_user(username=usename, password=password, mobile=mobile)
+                try:
+                    consumed = code_store.consume_sms_code(mobile, sms_code)
+                except Exception as e:
+                    logger.error('redis执行异常：\n{}'.format(e))
+                    consumed = None
+                if not consumed:
+                    transaction.set_rollback(True)
+            if consumed is None:
+                return to_json_data(errno=Code.UNKOWNERR, errmsg='服务器繁忙，请稍后重试')
+            if not consumed:
+                return to_json_data(errno=Code.PARAMERR, errmsg='短信验证码错误')
             login(request.user)
             return to_json_data(errmsg='恭喜你，注册成功')
         else:
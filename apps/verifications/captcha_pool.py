@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+预先生成的图片验证码池
+fill_captcha_pool 命令用进程池生成 (text, 图片) 放入redis列表，每种输出格式一个列表，
+请求时按Accept协商出格式后 LPOP 取出一张，只需保存 img_<uuid>；池为空时退回同步生成
+"""
+import itertools
+import logging
+import multiprocessing
+import random
+from functools import lru_cache
+
+from django_redis import get_redis_connection
+
+from config.captcha.captcha import captcha, supports
+from verifications import constants
+
+logger = logging.getLogger('django')
+
+POOL_KEY = 'image_code_pool_{}'
+# text与图片之间的分隔符，text只含大写字母和数字
+_SEP = b':'
+
+
+def get_connection():
+    return get_redis_connection(alias='verify_codes')
+
+
+def dumps(text, image):
+    return text.encode('ascii') + _SEP + image
+
+
+def loads(value):
+    text, image = value.split(_SEP, 1)
+    return text.decode('ascii'), image
+
+
+@lru_cache(maxsize=None)
+def formats():
+    """
+    可用的输出格式，跳过当前PIL不支持的格式（如未编译libwebp），最后一个作为兜底总是保留
+    """
+    names = constants.IMAGE_CODE_FORMATS
+    return tuple([name for name in names[:-1] if supports(constants.IMAGE_CODE_ENCODERS[name]['format'])]) + names[-1:]
+
+
+def accepted_types(accept):
+    """:return: Accept中明确列出且q大于0的媒体类型"""
+    types = set()
+    for part in accept.split(','):
+        media_type, *params = part.split(';')
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            types.add(media_type.strip().lower())
+    return types
+
+
+def negotiate(accept):
+    """
+    按 IMAGE_CODE_FORMATS 的顺序取第一个Accept中明确列出的格式，
+    */* 和 image/* 不算，老浏览器也会发送它们但不一定支持webp
+    :return: 格式名
+    """
+    types = accepted_types(accept or '')
+    names = formats()
+    for name in names[:-1]:
+        if constants.IMAGE_CODE_ENCODERS[name]['content_type'] in types:
+            return name
+    return names[-1]
+
+
+def content_type(name):
+    return constants.IMAGE_CODE_ENCODERS[name]['content_type']
+
+
+def render(name):
+    """同步生成一张name格式的验证码，:return: (text, 图片数据)"""
+    encoder = constants.IMAGE_CODE_ENCODERS[name]
+    return captcha.generate(fmt=encoder['format'], options=encoder['options'])
+
+
+def take(name):
+    """
+    :return: (text, 图片数据)
+    """
+    try:
+        value = get_connection().lpop(POOL_KEY.format(name))
+    except Exception as e:
+        logger.error('验证码池读取失败：\n{}'.format(e))
+        value = None
+    if value is None:
+        logger.warning('验证码池{}为空，同步生成验证码'.format(name))
+        return render(name)
+    return loads(value)
+
+
+def size(name):
+    return get_connection().llen(POOL_KEY.format(name))
+
+
+def _init_worker():
+    # fork出的子进程继承了相同的随机数状态，需要重新播种，否则各进程生成相同的验证码
+    random.seed()
+
+
+def _render(name):
+    return dumps(*render(name))
+
+
+def fill(name, target=constants.CAPTCHA_POOL_SIZE, workers=constants.CAPTCHA_POOL_WORKERS,
+         batch_size=constants.CAPTCHA_POOL_BATCH_SIZE):
+    """
+    把name格式的池补充到target张
+    :return: 新生成的数量
+    """
+    con = get_connection()
+    key = POOL_KEY.format(name)
+    missing = target - con.llen(key)
+    if missing <= 0:
+        return 0
+    if workers <= 1:
+        values = map(_render, itertools.repeat(name, missing))
+        pool = None
+    else:
+        pool = multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker)
+        values = pool.imap_unordered(_render, itertools.repeat(name, missing), chunksize=16)
+    try:
+        batch = []
+        for value in values:
+            batch.append(value)
+            if len(batch) >= batch_size:
+                con.rpush(key, *batch)
+                batch = []
+        if batch:
+            con.rpush(key, *batch)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return missing
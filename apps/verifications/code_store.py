@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+图片、短信验证码的校验与消费
+用redis服务端的Lua脚本把“校验图片验证码并删除、检查发送间隔、保存短信验证码和间隔标记”
+合成一次往返；注册时表单用 check_sms_code 比对（不删除），用户写入数据库后再用 consume_sms_code
+校验并删除，各一次往返，注册失败时验证码仍可使用。一次注册共三次往返；验证码用过即删除，不能重放
+"""
+import random
+import string
+
+from django_redis import get_redis_connection
+
+from verifications import constants
+
+# issue_sms_code 的结果
+OK = 0
+IMAGE_CODE_INVALID = 1
+SMS_TOO_FREQUENT = 2
+
+# KEYS: img_<uuid>, sms_flag_<mobile>, sms_<mobile>
+# ARGV: 图片验证码, 短信验证码, 间隔标记的值, 发送间隔, 短信验证码有效期
+# 图片验证码无论对错都删除，猜错后需要换一张
+_ISSUE_SMS_CODE = """
+local real = redis.call('GET', KEYS[1])
+if not real then
+    return 1
+end
+redis.call('DEL', KEYS[1])
+if real ~= ARGV[1] then
+    return 1
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 2
+end
+redis.call('SETEX', KEYS[2], ARGV[4], ARGV[3])
+redis.call('SETEX', KEYS[3], ARGV[5], ARGV[2])
+return 0
+"""
+
+# KEYS: sms_<mobile>
+# ARGV: 短信验证码
+# 只在校验通过时删除，输错可以重试
+_CONSUME_SMS_CODE = """
+local real = redis.call('GET', KEYS[1])
+if real and real == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+_scripts = {}
+
+
+def get_connection():
+    return get_redis_connection(alias='verify_codes')
+
+
+def _run(name, source, keys, args):
+    # register_script 返回的脚本对象先EVALSHA，服务端没有缓存时再EVAL
+    con = get_connection()
+    script = _scripts.get(name)
+    if script is None:
+        script = _scripts[name] = con.register_script(source)
+    return script(keys=keys, args=args, client=con)
+
+
+def image_code_key(image_code_id):
+    return 'img_{}'.format(image_code_id)
+
+
+def sms_code_key(mobile):
+    return 'sms_{}'.format(mobile)
+
+
+def sms_flag_key(mobile):
+    return 'sms_flag_{}'.format(mobile)
+
+
+def issue_sms_code(image_code_id, image_text, mobile):
+    """
+    校验并删除图片验证码，未在发送间隔内时生成并保存短信验证码
+    :return: (结果, 短信验证码)，结果不为OK时短信验证码为None
+    """
+    sms_code = ''.join([random.choice(string.digits) for _ in range(constants.SMS_CODE_NUMS)])
+    result = _run('issue_sms_code', _ISSUE_SMS_CODE,
+                  [image_code_key(image_code_id), sms_flag_key(mobile), sms_code_key(mobile)],
+                  [image_text, sms_code, constants.SMS_CODE_TD,
+                   constants.SMS_CODE_REDIS_INTERVAL, constants.SMS_CODE_REDIS_EXPIRES])
+    return result, sms_code if result == OK else None
+
+
+def check_sms_code(mobile, sms_code):
+    """:return: 短信验证码是否正确，不删除"""
+    real = get_connection().get(sms_code_key(mobile))
+    return real is not None and real.decode('utf-8') == sms_code
+
+
+def consume_sms_code(mobile, sms_code):
+    """:return: 短信验证码正确时删除并返回True"""
+    return _run('consume_sms_code', _CONSUME_SMS_CODE, [sms_code_key(mobile)], [sms_code]) == 1
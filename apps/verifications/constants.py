@@ -13,4 +13,29 @@ SMS_CODE_TD = 1
 SMS_CODE_REDIS_INTERVAL = 60
 
 # 短信验证码有效期
-SMS_CODE_REDIS_EXPIRES = 5 * 60
\ No newline at end of file
+SMS_CODE_REDIS_EXPIRES = 5 * 60
+
+# 验证码池补充到的数量
+CAPTCHA_POOL_SIZE = 5000
+
+# 验证码池低于该数量时补充
+CAPTCHA_POOL_LOW = 2000
+
+# 生成验证码的进程数
+CAPTCHA_POOL_WORKERS = 4
+
+# 每次写入redis的验证码数量
+CAPTCHA_POOL_BATCH_SIZE = 200
+
+# 验证码池检查间隔，单位秒
+CAPTCHA_POOL_INTERVAL = 1
+
+# 图片验证码输出格式，按优先顺序与请求头Accept协商，Accept中未明确列出的跳过，都不满足时使用最后一个
+IMAGE_CODE_FORMATS = ('webp', 'jpeg')
+
+# 各输出格式的PIL编码参数，见 config.captcha.captcha.encode，png的colors为调色板颜色数
+IMAGE_CODE_ENCODERS = {
+    'webp': {'format': 'WEBP', 'content_type': 'image/webp', 'options': {'quality': 50}},
+    'jpeg': {'format': 'JPEG', 'content_type': 'image/jpeg', 'options': {'quality': 50, 'optimize': True}},
+    'png': {'format': 'PNG', 'content_type': 'image/png', 'options': {'colors': 8, 'optimize': True}},
+}
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import logging
+
 from django import forms
 from django.core.validators import RegexValidator
 
-from users.models import Users
-from django_redis import get_redis_connection
+from users import exists_index
+from verifications import code_store
+
+logger = logging.getLogger('django')
 
 # 创建手机号的正则校验器
 mobile_validator = RegexValidator(r"^1[3-9]\d{9}$", "手机号码格式不正确")
@@ -30,24 +34,21 @@ class CheckImgCodeForm(forms.Form):
         img_uuid = clean_data.get('image_code_id')
 
         # 验证手机
-        if Users.objects.filter(mobile=mobile_num):
+        if mobile_num and exists_index.mobile_exists(mobile_num):
             raise forms.ValidationError('手机号已经注册，请登录')
 
-        # 验证验证码
-        con_redis = get_redis_connection(alias="verify_codes") # 连接数据库
-        img_key = 'img_{}'.format(img_uuid)
-        real_image_code_origin = con_redis.get(img_key)
-        # if real_image_code_origin:
-        #     real_image_code = real_image_code_origin.decode('utf8')
-        # else:
-        #     real_image_code = None
-        real_image_code = real_image_code_origin.decode('utf8') if real_image_code_origin else None
-
-        if not real_image_code or image_text != real_image_code:
-            raise forms.ValidationError('验证码有误')
+        if self.errors:
+            return clean_data
 
-        # 检查是否在60s内有发送记录
-        sms_flag_fmt = "sms_flag_{}".format(mobile_num).encode('utf-8')
-        sms_flag = con_redis.get(sms_flag_fmt)
-        if sms_flag:
-            raise forms.ValidationError("获取手机短信验证码过于频繁")
\ No newline at end of file
+        # 一次往返中验证并删除图片验证码、检查是否在60s内有发送记录、保存短信验证码
+        try:
+            result, sms_code = code_store.issue_sms_code(img_uuid, image_text, mobile_num)
+        except Exception as e:
+            logger.error('redis执行异常：\n{}'.format(e))
+            raise forms.ValidationError('服务器繁忙，请稍后重试')
+        if result == code_store.IMAGE_CODE_INVALID:
+            raise forms.ValidationError('验证码有误')
+        if result == code_store.SMS_TOO_FREQUENT:
+            raise forms.ValidationError("获取手机短信验证码过于频繁")
+        clean_data['sms_code'] = sms_code
+        return clean_data
\ No newline at end of file
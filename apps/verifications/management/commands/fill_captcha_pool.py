@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from verifications import captcha_pool
+from verifications import constants
+
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = '预先生成图片验证码，补充验证码池'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='常驻运行，低于低水位时补充')
+        parser.add_argument('--interval', type=float, default=constants.CAPTCHA_POOL_INTERVAL,
+                            help='检查间隔，单位秒')
+        parser.add_argument('--size', type=int, default=constants.CAPTCHA_POOL_SIZE, help='补充到的数量')
+        parser.add_argument('--low', type=int, default=constants.CAPTCHA_POOL_LOW, help='低水位')
+        parser.add_argument('--workers', type=int, default=constants.CAPTCHA_POOL_WORKERS, help='进程数')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                for name in captcha_pool.formats():
+                    if captcha_pool.size(name) < options['low'] or not options['loop']:
+                        start = time.time()
+                        count = captcha_pool.fill(name, options['size'], options['workers'])
+                        if count:
+                            self.stdout.write('生成{}张{}验证码，耗时{:.1f}秒'.format(count, name, time.time() - start))
+            except Exception as e:
+                logger.error('验证码池补充失败：\n{}'.format(e))
+                if not options['loop']:
+                    raise
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
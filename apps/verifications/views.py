@@ -1,18 +1,18 @@
 from django.shortcuts import render
 from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.views import View
 from django_redis import get_redis_connection
 
-from config.captcha.captcha import captcha
 from config.yuntongxun.sms import CCP
-from users import models
+from users import exists_index
 from verifications.forms import CheckImgCodeForm
 from verifications import constants
+from verifications import captcha_pool
+from verifications import code_store
 from config.json_fun import to_json_data
 from config.res_code import Code, error_map
 
-import random
-import string
 import logging
 import json
 
@@ -27,16 +27,20 @@ class ImageCode(View):
     图片验证码模块
     """
     def get(self, request, image_code_id):
-        # 生成验证码并分别接受图片和数据
-        text, image = captcha.generate_captcha()
+        # 按Accept协商图片格式，从预先生成的验证码池中取出一张，池为空时同步生成
+        image_format = captcha_pool.negotiate(request.META.get('HTTP_ACCEPT'))
+        text, image = captcha_pool.take(image_format)
         # 连接数据库
         con_redis = get_redis_connection(alias="verify_codes")
         # 接受ajax生成的UUID
-        img_key = 'img_{}'.format(image_code_id)
+        img_key = code_store.image_code_key(image_code_id)
         # 数据库保存图片数据（UUID，图片保存期，图片内容）
         con_redis.setex(img_key, constants.IMAGE_CODE_REDIS_EXPIRES, text)
         logger.info("image_code: {}".format(text))
-        return HttpResponse(content=image, content_type='image/jpg')
+        response = HttpResponse(content=image, content_type=captcha_pool.content_type(image_format))
+        # 同一地址按Accept返回不同格式，告知中间缓存
+        patch_vary_headers(response, ('Accept',))
+        return response
 
 
 class CheckUsernameView(View):
@@ -45,8 +49,8 @@ class CheckUsernameView(View):
     用户名验证模块
     """
     def get(self, request, username):
-        # 数据库查询用户名是否注册（能否查到）
-        count = models.Users.objects.filter(username=username).count()
+        # 查询用户名是否注册，先查存在性索引，不存在时不访问数据库
+        count = 1 if exists_index.username_exists(username) else 0
         # 生成json数据
         data = {
             'count': count,
@@ -61,8 +65,8 @@ class CheckMobileView(View):
     用户手机验证模块
     """
     def get(self, request, mobile):
-        # 数据库查询手机是否注册（能否查到）
-        count = models.Users.objects.filter(mobile=mobile).count()
+        # 查询手机是否注册，先查存在性索引，不存在时不访问数据库
+        count = 1 if exists_index.mobile_exists(mobile) else 0
         # 生成json数据
         data = {
             'count': count,
@@ -84,25 +88,12 @@ class SmsCodesView(View):
 
         dict_data = json.loads(json_data.decode("utf8"))
 
-        # 2.验证参数（form验证is_valid()）
+        # 2.验证参数（form验证is_valid()），验证通过时短信验证码已生成并保存
         form = CheckImgCodeForm(data=dict_data)
         if form.is_valid():
-            # 3.生成验证码并发送
+            # 3.发送验证码
             mobile = form.cleaned_data.get('mobile')
-            sms_num = ''.join([random.choice(string.digits) for _ in range(constants.SMS_CODE_NUMS)])
-            # 连接数据库
-            con_redis = get_redis_connection(alias='verify_codes')
-            p1 = con_redis.pipeline()
-            sms_text_fmt = 'sms_{}'.format(mobile)
-            sms_flg_fmt = 'sms_flag_{}'.format(mobile)
-            try:
-                p1.setex(sms_flg_fmt, constants.SMS_CODE_REDIS_INTERVAL, constants.SMS_CODE_TD)
-                p1.setex(sms_text_fmt, constants.SMS_CODE_REDIS_EXPIRES, sms_num)
-                # 让管道通知redis执行命令
-                p1.execute()
-            except Exception as e:
-                logger.debug('redis执行异常'.format(e))
-                return to_json_data(errno=Code.UNKOWNERR, errmsg=error_map[Code.UNKOWNERR])
+            sms_num = form.cleaned_data.get('sms_code')
             logger.info("Sms code: {}".format(sms_num))
 
             return to_json_data(errno=Code.OK, errmsg='发送正常')
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+验证码生成基准
+    python -m config.captcha.benchmark [-n 次数] [-p 进程数] [--scaling] [--no-numpy] [--encoders] [--json 报告路径]
+                                       [--compare]
+统计 generate() 每张验证码各阶段（background, text, curve, noise, smooth, save）耗时的百分位数和每秒生成数；
+-p 大于1时用进程池并行生成，--scaling 依次以 1, 2, 4, ... 个进程运行，观察多核扩展；
+--encoders 对同一批图片用 ENCODERS 中的各种编码参数编码，统计编码耗时和图片大小；
+--json 把结果写成键有序的JSON，便于在评审中对比优化前后的报告；
+--compare 分别在不使用、使用字体和字符缓存，以及PIL、numpy绘制曲线噪点时测量吞吐量
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import time
+
+import PIL
+
+from config.captcha.captcha import Captcha, encode, numpy, supports
+
+STAGES = ('background', 'text', 'curve', 'noise', 'smooth', 'save')
+PERCENTILES = (50, 90, 99)
+WARMUP = 20
+# (名称, 格式, 编码参数)
+ENCODERS = (
+    ('jpeg', 'JPEG', {}),
+    ('jpeg-q50', 'JPEG', {'quality': 50}),
+    ('jpeg-q50-optimize', 'JPEG', {'quality': 50, 'optimize': True}),
+    ('jpeg-q50-progressive', 'JPEG', {'quality': 50, 'optimize': True, 'progressive': True}),
+    ('png', 'PNG', {}),
+    ('png-16colors', 'PNG', {'colors': 16, 'optimize': True}),
+    ('png-8colors', 'PNG', {'colors': 8, 'optimize': True}),
+    ('webp-q50', 'WEBP', {'quality': 50}),
+    ('webp-q75', 'WEBP', {'quality': 75}),
+)
+
+
+def throughput(captcha, number):
+    """:return: 每秒生成的验证码数"""
+    # 预热，使缓存在计时前填满
+    for _ in range(min(number, WARMUP)):
+        captcha.generate_captcha()
+    start = time.perf_counter()
+    for _ in range(number):
+        captcha.generate_captcha()
+    return number / (time.perf_counter() - start)
+
+
+def compare(attribute, number):
+    """开关Captcha的attribute属性前后的吞吐量"""
+    captcha = Captcha()
+    results = {}
+    for name, value in (('before', False), ('after', True)):
+        setattr(captcha, attribute, value)
+        results[name] = throughput(captcha, number)
+    return results
+
+
+def compare_glyph_cache(number):
+    return compare('use_glyph_cache', number)
+
+
+def compare_numpy(number):
+    return compare('use_numpy', number)
+
+
+def _init_worker():
+    # fork出的子进程继承了相同的随机数状态
+    random.seed()
+
+
+def profile(args):
+    """
+    单个进程内生成number张验证码
+    :return: [{阶段: 秒}, ...]，每张一个字典，另含 total
+    """
+    number, width, height, fmt = args
+    captcha = Captcha()
+    for _ in range(min(number, WARMUP)):
+        captcha.generate(width, height, fmt=fmt)
+    samples = []
+    for _ in range(number):
+        timings = {}
+        captcha.generate(width, height, fmt=fmt, timings=timings)
+        timings['total'] = sum(timings.values())
+        samples.append(timings)
+    return samples
+
+
+def percentile(values, q):
+    """最近秩法，values已排序"""
+    return values[max(0, min(len(values) - 1, int(round(q / 100 * len(values))) - 1))]
+
+
+def summarize(samples):
+    """:return: {阶段: {'mean_ms':, 'p50_ms':, ...}}"""
+    summary = {}
+    for stage in STAGES + ('total',):
+        values = sorted(sample.get(stage, 0) * 1000 for sample in samples)
+        stats = {'mean_ms': round(sum(values) / len(values), 4)}
+        for q in PERCENTILES:
+            stats['p{}_ms'.format(q)] = round(percentile(values, q), 4)
+        summary[stage] = stats
+    return summary
+
+
+def run(number, processes=1, width=200, height=75, fmt='JPEG'):
+    """
+    共生成number张，processes大于1时平均分给进程池中的各进程
+    :return: 报告字典
+    """
+    if processes <= 1:
+        start = time.perf_counter()
+        samples = profile((number, width, height, fmt))
+        elapsed = time.perf_counter() - start
+    else:
+        tasks = [(number // processes + (1 if i < number % processes else 0), width, height, fmt)
+                 for i in range(processes)]
+        pool = multiprocessing.get_context('fork').Pool(processes, initializer=_init_worker)
+        try:
+            start = time.perf_counter()
+            samples = [sample for chunk in pool.imap_unordered(profile, tasks) for sample in chunk]
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.close()
+            pool.join()
+    # 墙上时间包含预热，与 -n 相比预热次数越多吞吐量越偏低
+    return {
+        'processes': processes,
+        'number': len(samples),
+        'images_per_sec': round(len(samples) / elapsed, 2),
+        'stages': summarize(samples),
+    }
+
+
+def compare_encoders(number, width=200, height=75):
+    """
+    :return: {名称: {'format':, 'options':, 'mean_bytes':, 'mean_ms':, 'p50_ms':, ...}}，跳过PIL不支持的格式
+    """
+    captcha = Captcha()
+    images = [captcha.render(width, height)[1] for _ in range(number)]
+    results = {}
+    for name, fmt, options in ENCODERS:
+        if not supports(fmt):
+            continue
+        sizes = []
+        times = []
+        for image in images:
+            start = time.perf_counter()
+            sizes.append(len(encode(image, fmt, **options)))
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        stats = {'format': fmt, 'options': options, 'mean_bytes': round(sum(sizes) / len(sizes)),
+                 'mean_ms': round(sum(times) / len(times), 4)}
+        for q in PERCENTILES:
+            stats['p{}_ms'.format(q)] = round(percentile(times, q), 4)
+        results[name] = stats
+    return results
+
+
+def print_encoders(results):
+    columns = ('mean_bytes', 'mean_ms') + tuple('p{}_ms'.format(q) for q in PERCENTILES)
+    print('{:<24}'.format('encoder') + ''.join('{:>12}'.format(c) for c in columns))
+    for name, stats in results.items():
+        print('{:<24}{:>12}'.format(name, stats['mean_bytes']) +
+              ''.join('{:>12.3f}'.format(stats[c]) for c in columns[1:]))
+
+
+def environment(width, height, fmt):
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'numpy': numpy.__version__ if numpy is not None else None,
+        'cpu_count': os.cpu_count(),
+        'use_numpy': Captcha.use_numpy,
+        'use_glyph_cache': Captcha.use_glyph_cache,
+        'width': width,
+        'height': height,
+        'format': fmt,
+    }
+
+
+def print_result(result):
+    print('processes={processes} number={number} {images_per_sec:.1f} captcha/s'.format(**result))
+    columns = ('mean_ms',) + tuple('p{}_ms'.format(q) for q in PERCENTILES)
+    print('{:<12}'.format('stage') + ''.join('{:>10}'.format(c) for c in columns))
+    for stage, stats in result['stages'].items():
+        print('{:<12}'.format(stage) + ''.join('{:>10.3f}'.format(stats[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='验证码生成基准')
+    parser.add_argument('-n', '--number', type=int, default=500, help='生成次数')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='进程数')
+    parser.add_argument('--scaling', action='store_true', help='以 1, 2, 4, ... 直到 --processes 个进程依次运行')
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--height', type=int, default=75)
+    parser.add_argument('--format', default='JPEG', help='图片格式')
+    parser.add_argument('--no-numpy', action='store_true', help='曲线、噪点、平滑使用PIL绘制')
+    parser.add_argument('--encoders', action='store_true', help='对比各种编码参数的耗时和图片大小')
+    parser.add_argument('--json', help='JSON报告的保存路径')
+    parser.add_argument('--compare', action='store_true', help='对比字体缓存、numpy开关前后的吞吐量')
+    args = parser.parse_args()
+
+    if args.compare:
+        comparisons = [('use_glyph_cache', compare_glyph_cache)]
+        if numpy is not None:
+            comparisons.append(('use_numpy', compare_numpy))
+        for title, func in comparisons:
+            results = func(args.number)
+            print(title)
+            for name, value in results.items():
+                print('{:<8}{:>10.1f} captcha/s'.format(name, value))
+            print('speedup {:>10.2f}x'.format(results['after'] / results['before']))
+        return
+
+    if args.no_numpy:
+        Captcha.use_numpy = False
+
+    if args.scaling:
+        counts = []
+        processes = 1
+        while processes < args.processes:
+            counts.append(processes)
+            processes *= 2
+        counts.append(args.processes)
+    else:
+        counts = [args.processes]
+
+    report = {'environment': environment(args.width, args.height, args.format), 'runs': []}
+    for processes in counts:
+        result = run(args.number, processes, args.width, args.height, args.format)
+        report['runs'].append(result)
+        print_result(result)
+        print()
+
+    if args.encoders:
+        report['encoders'] = compare_encoders(args.number, args.width, args.height)
+        print_encoders(report['encoders'])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,9 @@
 import random
 import string
 import os.path
+import threading
+import time
+from functools import lru_cache
 from io import BytesIO
 
 from PIL import Image
@@ -11,11 +14,17 @@ from PIL import ImageFilter
 from PIL.ImageDraw import Draw
 from PIL.ImageFont import truetype
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class Bezier:
     def __init__(self):
         self.tsequence = tuple([t / 20.0 for t in range(21)])
         self.beziers = {}
+        self.matrices = {}
 
     def pascal_row(self, n):
         """ Returns n-th row of Pascal's triangle
@@ -51,8 +60,90 @@ class Bezier:
             self.beziers[n] = result
             return result
 
+    def make_bezier_matrix(self, n):
+        """ 系数矩阵，形状为 (len(tsequence), n)，曲线上的点 = 矩阵 @ 控制点
+        """
+        try:
+            return self.matrices[n]
+        except KeyError:
+            self.matrices[n] = numpy.array(self.make_bezier(n))
+            return self.matrices[n]
+
+
+# 同一个FreeType字体对象不能被多个线程同时用来绘制
+_font_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def load_font(name, size):
+    """每个进程每种字体、字号只解析一次字体文件"""
+    return truetype(name, size)
+
+
+@lru_cache(maxsize=1024)
+def glyph_mask(name, size, char):
+    """
+    裁剪后的单个字符灰度蒙版（未着色），调用方不能修改返回的图片
+    """
+    font = load_font(name, size)
+    with _font_lock:
+        mask = Image.new('L', Draw(Image.new('L', (1, 1))).textsize(char, font=font), 0)
+        Draw(mask).text((0, 0), char, font=font, fill=255)
+    return mask.crop(mask.getbbox())
+
+
+# 字符图片转为粘贴蒙版的亮度映射表，等同于 point(lambda i: i * 1.97)，但不必每次调用256次lambda
+MASK_TABLE = [i * 1.97 for i in range(256)]
+
+
+@lru_cache(maxsize=None)
+def rect_offsets(width, height):
+    """从 (x, y) 向右width、上下共height个像素的矩形的像素偏移 (dy, dx)"""
+    dy, dx = numpy.meshgrid(numpy.arange(-(height // 2), height - height // 2), numpy.arange(width), indexing='ij')
+    return dy.ravel(), dx.ravel()
+
+
+def supports(fmt):
+    """当前安装的PIL能否保存为fmt格式（WEBP依赖编译时的libwebp）"""
+    Image.init()
+    return fmt.upper() in Image.SAVE
+
+
+def encode(image, fmt='JPEG', **options):
+    """
+    :param options: PIL的保存参数，如JPEG的quality、progressive、optimize，WEBP的quality、method；
+                    另支持colors，先量化为该颜色数的调色板图片（用于PNG）
+    :return: 图片字节
+    """
+    colors = options.pop('colors', None)
+    if colors:
+        image = image.quantize(colors)
+    out = BytesIO()
+    image.save(out, format=fmt, **options)
+    return out.getvalue()
+
+
+class StageTimer(object):
+    """
+    累计 generate() 各阶段的耗时（秒）到timings字典，timings为None时不计时
+    """
+    def __init__(self, timings):
+        self.timings = timings
+        self.last = time.perf_counter() if timings is not None else 0
+
+    def __call__(self, stage):
+        if self.timings is not None:
+            now = time.perf_counter()
+            self.timings[stage] = self.timings.get(stage, 0) + now - self.last
+            self.last = now
+
 
 class Captcha(object):
+    # 为False时每次重新加载字体、绘制字符（用于基准对比）
+    use_glyph_cache = True
+    # 为False时曲线、噪点、平滑使用PIL逐次绘制（用于对比输出和基准）
+    use_numpy = numpy is not None
+
     def __init__(self):
         self._bezier = Bezier()
         self._dir = os.path.dirname(__file__)
@@ -66,12 +157,22 @@ class Captcha(object):
 
     def initialize(self, width=200, height=75, color=None, text=None, fonts=None):
         # self.image = Image.new('RGB', (width, height), (255, 255, 255))
-        self._text = text if text else random.sample(string.ascii_uppercase + string.ascii_uppercase + '3456789', 4)
-        self.fonts = fonts if fonts else \
-            [os.path.join(self._dir, 'fonts', font) for font in ['Arial.ttf', 'Georgia.ttf', 'actionj.ttf']]
+        self._text = text if text else self.random_text()
+        self.fonts = fonts if fonts else self.default_fonts()
         self.width = width
         self.height = height
-        self._color = color if color else self.random_color(0, 200, random.randint(220, 255))
+        self._color = color if color else self.text_color()
+
+    @staticmethod
+    def random_text():
+        return random.sample(string.ascii_uppercase + string.ascii_uppercase + '3456789', 4)
+
+    def default_fonts(self):
+        return [os.path.join(self._dir, 'fonts', font) for font in ['Arial.ttf', 'Georgia.ttf', 'actionj.ttf']]
+
+    @classmethod
+    def text_color(cls):
+        return cls.random_color(0, 200, random.randint(220, 255))
 
     @staticmethod
     def random_color(start, end, opacity=None):
@@ -118,20 +219,76 @@ class Captcha(object):
             draw.line(((x, y), (x + level, y)), fill=color if color else self._color, width=level)
         return image
 
-    def text(self, image, fonts, font_sizes=None, drawings=None, squeeze_factor=0.75, color=None):
+    # draw image (numpy)
+    # 随机数取自调用方传入的 numpy.random.Generator，*_array 方法直接修改 H x W x 3 的 uint8 数组
+
+    @staticmethod
+    def stamp(array, xs, ys, offsets, color):
+        """在整数坐标 (xs, ys) 处一次性盖上offsets形状的笔刷，超出图片的部分丢弃"""
+        dy, dx = offsets
+        rows = (ys[:, None] + dy).ravel()
+        cols = (xs[:, None] + dx).ravel()
+        inside = (rows >= 0) & (rows < array.shape[0]) & (cols >= 0) & (cols < array.shape[1])
+        array[rows[inside], cols[inside]] = color[:3]
+        return array
+
+    def curve_matrix(self, image, rng, width=4, number=6, color=None):
+        """控制点一次生成，贝塞尔曲线上的点由系数矩阵相乘得到，再交给PIL画折线"""
+        dx, height = image.size
+        dx /= number
+        path = numpy.column_stack((dx * numpy.arange(1, number),
+                                   rng.integers(0, height, number - 1, endpoint=True)))
+        points = self._bezier.make_bezier_matrix(number - 1) @ path
+        Draw(image).line(points.ravel().tolist(), fill=color if color else self._color, width=width)
+        return image
+
+    def noise_array(self, array, rng, number=50, level=2, color=None):
+        height, width = array.shape[:2]
+        xs = rng.uniform(width / 10, width - width / 10, number).astype(int)
+        ys = rng.uniform(height / 10, height - height / 10, number).astype(int)
+        return self.stamp(array, xs, ys, rect_offsets(level + 1, level), color if color else self._color)
+
+    @staticmethod
+    def smooth_array(array):
+        """与 ImageFilter.SMOOTH 相同的3x3卷积核 (1 1 1, 1 5 1, 1 1 1) / 13，最外一圈像素不变"""
+        src = array.astype(numpy.uint16)
+        height, width = src.shape[:2]
+        total = src[1:-1, 1:-1] * 4
+        for dy in range(3):
+            for dx in range(3):
+                total += src[dy:height - 2 + dy, dx:width - 2 + dx]
+        array[1:-1, 1:-1] = (total + 6) // 13
+        return array
+
+    def char_image(self, font_key, c, color):
+        """
+        从缓存的蒙版生成着色后的字符图片，与直接绘制结果相同
+        """
+        mask = glyph_mask(font_key[0], font_key[1], c)
+        char_image = Image.new('RGB', mask.size, (0, 0, 0))
+        char_image.paste(color[:3], mask=mask)
+        return char_image
+
+    def text(self, image, fonts, font_sizes=None, drawings=None, squeeze_factor=0.75, color=None, chars=None):
         color = color if color else self._color
-        fonts = tuple([truetype(name, size)
-                       for name in fonts
-                       for size in font_sizes or (65, 70, 75)])
+        chars = chars if chars else self._text
+        font_keys = tuple([(name, size)
+                           for name in fonts
+                           for size in font_sizes or (65, 70, 75)])
+        if not self.use_glyph_cache:
+            fonts = tuple([truetype(name, size) for name, size in font_keys])
         draw = Draw(image)
         char_images = []
-        for c in self._text:
-            font = random.choice(fonts)
-            c_width, c_height = draw.textsize(c, font=font)
-            char_image = Image.new('RGB', (c_width, c_height), (0, 0, 0))
-            char_draw = Draw(char_image)
-            char_draw.text((0, 0), c, font=font, fill=color)
-            char_image = char_image.crop(char_image.getbbox())
+        for c in chars:
+            if self.use_glyph_cache:
+                char_image = self.char_image(random.choice(font_keys), c, color)
+            else:
+                font = random.choice(fonts)
+                c_width, c_height = draw.textsize(c, font=font)
+                char_image = Image.new('RGB', (c_width, c_height), (0, 0, 0))
+                char_draw = Draw(char_image)
+                char_draw.text((0, 0), c, font=font, fill=color)
+                char_image = char_image.crop(char_image.getbbox())
             for drawing in drawings:
                 d = getattr(self, drawing)
                 char_image = d(char_image)
@@ -142,7 +299,7 @@ class Captcha(object):
                       char_images[-1].size[0]) / 2)
         for char_image in char_images:
             c_width, c_height = char_image.size
-            mask = char_image.convert('L').point(lambda i: i * 1.97)
+            mask = char_image.convert('L').point(MASK_TABLE)
             image.paste(char_image,
                         (offset, int((height - c_height) / 2)),
                         mask)
@@ -197,23 +354,70 @@ class Captcha(object):
                 ('JGW9', '\x89PNG\r\n\x1a\n\x00\x00\x00\r...')
 
         """
-        image = Image.new('RGB', (self.width, self.height), (255, 255, 255))
-        image = self.background(image)
-        image = self.text(image, self.fonts, drawings=['warp', 'rotate', 'offset'])
-        image = self.curve(image)
-        image = self.noise(image)
-        image = self.smooth(image)
-        text = "".join(self._text)
-        out = BytesIO()
-        image.save(out, format=fmt)
-        return text, out.getvalue()
+        return self.generate(self.width, self.height, self._text, self._color, self.fonts, fmt)
+
+    def render(self, width=200, height=75, text=None, color=None, fonts=None, timer=None):
+        """
+        无状态地绘制验证码，每次调用的文字、颜色、尺寸都是局部变量，不写入self，
+        可以在多个线程中同时调用同一个实例
+        :return: (文字, 未编码的图片)
+        """
+        text = text if text else self.random_text()
+        color = color if color else self.text_color()
+        fonts = fonts if fonts else self.default_fonts()
+        timer = timer if timer else StageTimer(None)
+        if self.use_numpy:
+            # 随机数生成器由random播种，fork出的进程重新播种random即可
+            rng = numpy.random.default_rng(random.getrandbits(64))
+            image = Image.new('RGB', (width, height), self.random_color(238, 255))
+            timer('background')
+            image = self.text(image, fonts, drawings=['warp', 'rotate', 'offset'], color=color, chars=text)
+            timer('text')
+            image = self.curve_matrix(image, rng, color=color)
+            timer('curve')
+            array = numpy.array(image)
+            self.noise_array(array, rng, color=color)
+            timer('noise')
+            image = Image.fromarray(self.smooth_array(array))
+            timer('smooth')
+        else:
+            image = Image.new('RGB', (width, height), (255, 255, 255))
+            image = self.background(image)
+            timer('background')
+            image = self.text(image, fonts, drawings=['warp', 'rotate', 'offset'], color=color, chars=text)
+            timer('text')
+            image = self.curve(image, color=color)
+            timer('curve')
+            image = self.noise(image, color=color)
+            timer('noise')
+            image = self.smooth(image)
+            timer('smooth')
+        return "".join(text), image
+
+    def generate(self, width=200, height=75, text=None, color=None, fonts=None, fmt='JPEG', timings=None,
+                 options=None):
+        """
+        :param options: 编码参数，见 encode()
+        :param timings: 传入字典时记录各阶段耗时，见 StageTimer
+        :return: (文字, 图片字节)
+        """
+        timer = StageTimer(timings)
+        text, image = self.render(width, height, text, color, fonts, timer)
+        data = encode(image, fmt, **(options or {}))
+        timer('save')
+        return text, data
 
     def generate_captcha(self):
-        self.initialize()
-        return self.captcha("")
+        return self.generate()
 
 
 captcha = Captcha.instance()
 
+
+def generate(width=200, height=75, text=None, fmt='JPEG', options=None):
+    """线程、进程安全的验证码生成入口，:return: (文字, 图片字节)"""
+    return captcha.generate(width, height, text, fmt=fmt, options=options)
+
+
 if __name__ == '__main__':
     print(captcha.generate_captcha())
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+条件GET（ETag / Last-Modified）
+视图先用廉价的版本号计算校验值，命中时在渲染模板或序列化之前直接返回304
+"""
+import calendar
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """
+    由版本号等信息生成强ETag
+    :param parts: 任意可转为字符串的值
+    :return: 带引号的ETag
+    """
+    raw = '|'.join(str(p) for p in parts)
+    return quote_etag(hashlib.md5(raw.encode('utf8')).hexdigest())
+
+
+def to_timestamp(dt):
+    """aware datetime 转为秒级时间戳"""
+    return calendar.timegm(dt.utctimetuple()) if dt else None
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    :param request: 请求
+    :param etag: make_etag生成的ETag
+    :param last_modified: 最后修改时间（datetime）
+    :return: 304响应，或None表示需要正常处理
+    """
+    return get_conditional_response(request, etag=etag, last_modified=to_timestamp(last_modified))
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """在响应上设置 ETag / Last-Modified"""
+    if etag and not response.has_header('ETag'):
+        response['ETag'] = etag
+    if last_modified and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(to_timestamp(last_modified))
+    return response
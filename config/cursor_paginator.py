@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(Exception):
+    """游标无法解析"""
+    pass
+
+
+def encode_cursor(update_time, pk):
+    """
+    将(update_time, id)编码为不透明的游标字符串
+    :param update_time: 当前页最后一条数据的更新时间
+    :param pk: 当前页最后一条数据的id
+    :return: urlsafe base64字符串
+    """
+    raw = '{}|{}'.format(update_time.isoformat(), pk)
+    return base64.urlsafe_b64encode(raw.encode('utf8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+    :param cursor: encode_cursor生成的字符串
+    :return: (update_time, id)
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode((cursor + padding).encode('ascii')).decode('utf8')
+        time_str, pk = raw.rsplit('|', 1)
+        update_time = parse_datetime(time_str)
+        pk = int(pk)
+    except Exception as e:
+        raise InvalidCursor(e)
+    if update_time is None:
+        raise InvalidCursor('update_time格式错误')
+    return update_time, pk
+
+
+def get_cursor_page(queryset, cursor, per_page, key=None):
+    """
+    按 ('-update_time', '-id') 排序进行键集分页，不执行COUNT也不使用OFFSET
+    :param queryset: 查询集
+    :param cursor: 上一页返回的next_cursor，为空时返回第一页
+    :param per_page: 每页数量
+    :param key: 从单条数据中取出(update_time, id)的函数，默认按模型属性读取
+    :return: (当前页数据列表, 下一页游标或None)
+    """
+    queryset = queryset.order_by('-update_time', '-id')
+    if cursor:
+        update_time, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(update_time__lt=update_time) | Q(update_time=update_time, id__lt=pk)
+        )
+    # 多取一条用于判断是否还有下一页
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        key = key or (lambda obj: (obj.update_time, obj.id))
+        next_cursor = encode_cursor(*key(items[-1]))
+    return items, next_cursor
@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+本地磁盘倒排索引的 haystack 后端，无需 Elasticsearch
+在 HAYSTACK_CONNECTIONS 中配置：
+    'ENGINE': 'config.localsearch.backend.LocalSearchEngine',
+    'PATH': os.path.join(BASE_DIR, 'search_index'),
+"""
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+haystack 后端：索引保存在本地磁盘，按BM25排序
+查询条件序列化为JSON交给后端求值，全文条件走倒排索引，其余字段条件按存储字段过滤
+"""
+import datetime
+import json
+import logging
+import re
+from collections import Counter
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.html import strip_tags
+
+from haystack import connections
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, log_query
+from haystack.constants import DJANGO_CT, DJANGO_ID, DOCUMENT_FIELD
+from haystack.exceptions import NotHandled, SkipDocument
+from haystack.inputs import BaseInput
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+from haystack.utils.app_loading import haystack_get_model
+
+from config.localsearch import store
+from config.localsearch.tokenizer import normalize, tokenize
+
+logger = logging.getLogger('django')
+
+# delta.log超过该大小后合并为新段
+DEFAULT_MERGE_BYTES = 4 * 1024 * 1024
+
+# 存储字段中保存文档标识的键；索引可以定义名为 id 的字段（覆盖 prepare 结果中的 ID），
+# 因此标识单独存放，取出结果时只去掉这个键，不去掉索引字段
+STORED_IDENTIFIER = '_identifier'
+
+# 查询词：双引号内为一个整体，-开头表示排除
+_WORD_RE = re.compile(r'(-?)"([^"]*)"|(-?)(\S+)')
+
+
+def to_storable(value):
+    """转换为可JSON序列化的值，时间统一为UTC"""
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = value.astimezone(datetime.timezone.utc)
+        # 固定到微秒，保证字符串比较与时间比较一致
+        return value.isoformat(timespec='microseconds')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, set)):
+        return [to_storable(v) for v in value]
+    return value
+
+
+def to_python(field, value):
+    """存储值还原为索引字段对应的类型"""
+    if value is None or field is None:
+        return value
+    if field.field_type == 'datetime' and isinstance(value, str):
+        return parse_datetime(value)
+    if field.field_type == 'date' and isinstance(value, str):
+        return parse_date(value)
+    return value
+
+
+def parse_words(query_string):
+    """
+    :return: (必须出现的词组列表, 排除的词组列表)，每个词组是一个查询词切分出的词
+    """
+    required, excluded = [], []
+    for quoted_neg, quoted, neg, word in _WORD_RE.findall(query_string or ''):
+        tokens = tokenize(quoted or word)
+        if tokens:
+            (excluded if (quoted_neg or neg) else required).append(tokens)
+    return required, excluded
+
+
+def _compare(stored, filter_type, value):
+    """字段条件求值"""
+    if filter_type == 'in':
+        return stored in value
+    if filter_type == 'range':
+        return stored is not None and value[0] <= stored <= value[1]
+    if stored is None:
+        return False
+    if filter_type in ('exact', 'content'):
+        if isinstance(stored, list):
+            return value in stored
+        return stored == value
+    if filter_type == 'gt':
+        return stored > value
+    if filter_type == 'gte':
+        return stored >= value
+    if filter_type == 'lt':
+        return stored < value
+    if filter_type == 'lte':
+        return stored <= value
+    if filter_type == 'startswith':
+        return normalize(str(stored)).startswith(normalize(str(value)))
+    if filter_type in ('contains', 'fuzzy'):
+        return normalize(str(value)) in normalize(str(stored))
+    raise ValueError('不支持的过滤类型：{}'.format(filter_type))
+
+
+class LocalSearchBackend(BaseSearchBackend):
+
+    def __init__(self, connection_alias, **connection_options):
+        super(LocalSearchBackend, self).__init__(connection_alias, **connection_options)
+        if not connection_options.get('PATH'):
+            raise ImproperlyConfigured("'{}'连接需要配置PATH".format(connection_alias))
+        self.path = connection_options['PATH']
+        self.merge_bytes = connection_options.get('MERGE_BYTES', DEFAULT_MERGE_BYTES)
+
+    def get_reader(self):
+        return store.get_reader(self.path)
+
+    def prepare_document(self, index, obj):
+        """
+        :return: 增量操作，文档不需要索引时返回None
+        """
+        try:
+            prepared = index.full_prepare(obj)
+        except SkipDocument:
+            return None
+        content_field = index.get_content_field()
+        tokens = tokenize(strip_tags(prepared.get(content_field) or ''))
+        # 与 remove() 使用相同的标识，不能取 prepared[ID]，它可能被名为 id 的索引字段覆盖
+        identifier = get_identifier(obj)
+        stored = {STORED_IDENTIFIER: identifier, DJANGO_CT: prepared[DJANGO_CT], DJANGO_ID: prepared[DJANGO_ID]}
+        for name, field in index.fields.items():
+            if field.document or not field.stored:
+                continue
+            fieldname = field.index_fieldname
+            stored[fieldname] = to_storable(prepared.get(fieldname))
+        return {
+            'op': 'update',
+            'id': identifier,
+            'terms': Counter(tokens),
+            'length': len(tokens),
+            'stored': stored,
+        }
+
+    def update(self, index, iterable, commit=True):
+        ops = [op for op in (self.prepare_document(index, obj) for obj in iterable) if op]
+        store.append_ops(self.path, ops, self.merge_bytes)
+
+    def remove(self, obj_or_string, commit=True):
+        self.bulk_remove([get_identifier(obj_or_string)])
+
+    def bulk_remove(self, identifiers):
+        store.append_ops(self.path, [{'op': 'delete', 'id': i} for i in identifiers], self.merge_bytes)
+
+    def clear(self, models=None, commit=True):
+        if not models:
+            store.reset(self.path)
+            return
+        prefixes = tuple('{}.'.format(get_model_ct(model)) for model in models)
+        reader = self.get_reader()
+        identifiers = [reader.identifier(ref) for ref in reader.live_refs()]
+        self.bulk_remove([i for i in identifiers if i.startswith(prefixes)])
+
+    def merge(self):
+        store.merge(self.path)
+
+    # 查询
+
+    def _eval_leaf_text(self, reader, value):
+        required, excluded = parse_words(value)
+        if required:
+            scores = reader.match(required)
+        else:
+            scores = dict.fromkeys(reader.live_refs(), 0.0)
+        for tokens in excluded:
+            for ref in reader.match([tokens]):
+                scores.pop(ref, None)
+        return scores
+
+    def _is_text(self, leaf):
+        return leaf['field'] in ('content', DOCUMENT_FIELD) and leaf['filter_type'] in ('content', 'contains')
+
+    def _predicate(self, leaf):
+        field, filter_type, value = leaf['field'], leaf['filter_type'], leaf['value']
+        return lambda stored: _compare(stored.get(field), filter_type, value)
+
+    def _eval(self, reader, node):
+        """
+        :return: {文档引用: 分数}
+        """
+        predicates = []
+        results = []
+        for child in node['children']:
+            if 'children' in child:
+                results.append(self._eval(reader, child))
+            elif self._is_text(child):
+                results.append(self._eval_leaf_text(reader, child['value']))
+            else:
+                predicates.append(self._predicate(child))
+
+        if node['connector'] == 'AND':
+            scores = None
+            for result in results:
+                if scores is None:
+                    scores = result
+                else:
+                    scores = {ref: score + result[ref] for ref, score in scores.items() if ref in result}
+            if scores is None:
+                scores = dict.fromkeys(reader.live_refs(), 0.0)
+            for predicate in predicates:
+                scores = {ref: score for ref, score in scores.items() if predicate(reader.stored(ref))}
+        else:
+            scores = {}
+            for result in results:
+                for ref, score in result.items():
+                    scores[ref] = scores.get(ref, 0.0) + score
+            if predicates:
+                for ref in reader.live_refs():
+                    if ref not in scores and any(p(reader.stored(ref)) for p in predicates):
+                        scores[ref] = 0.0
+
+        if node['negated']:
+            scores = {ref: 0.0 for ref in reader.live_refs() if ref not in scores}
+        return scores
+
+    @staticmethod
+    def _narrow_predicate(narrow_query):
+        """narrow_queries 形如 'field:value'"""
+        field, _, value = narrow_query.partition(':')
+        value = value.strip('"')
+        return lambda stored: str(stored.get(field)) == value
+
+    @log_query
+    def search(self, query_string, sort_by=None, start_offset=0, end_offset=None, facets=None,
+               narrow_queries=None, models=None, result_class=None, **kwargs):
+        reader = self.get_reader()
+        query = json.loads(query_string) if query_string else {'connector': 'AND', 'negated': False, 'children': []}
+        scores = self._eval(reader, query)
+
+        predicates = [self._narrow_predicate(q) for q in narrow_queries or ()]
+        if models:
+            model_cts = {get_model_ct(model) for model in models}
+            predicates.append(lambda stored: stored[DJANGO_CT] in model_cts)
+        if predicates:
+            scores = {ref: score for ref, score in scores.items()
+                      if all(p(reader.stored(ref)) for p in predicates)}
+
+        # 分面统计按过滤后的全部结果计算
+        facet_counts = {}
+        if facets:
+            counters = {field: Counter() for field in facets}
+            for ref in scores:
+                stored = reader.stored(ref)
+                for field, counter in counters.items():
+                    value = stored.get(field)
+                    counter.update(value if isinstance(value, list) else [value])
+            facet_counts['fields'] = {
+                field: [(value, count) for value, count in counter.most_common() if value is not None]
+                for field, counter in counters.items()
+            }
+
+        ordered = sorted(scores.items(), key=lambda item: -item[1])
+        for order in reversed(sort_by or ()):
+            field, reverse = (order[1:], True) if order.startswith('-') else (order, False)
+            if field == 'score':
+                ordered.sort(key=lambda item: item[1], reverse=reverse)
+                continue
+            ordered.sort(key=lambda item: _sort_key(reader.stored(item[0]).get(field)), reverse=reverse)
+
+        hits = len(ordered)
+        page = ordered[start_offset:end_offset]
+        return {
+            'results': self._process_results(reader, page, result_class or SearchResult),
+            'hits': hits,
+            'facets': facet_counts,
+            'spelling_suggestion': None,
+        }
+
+    def _process_results(self, reader, page, result_class):
+        unified_index = connections[self.connection_alias].get_unified_index()
+        results = []
+        for ref, score in page:
+            stored = dict(reader.stored(ref))
+            app_label, model_name = stored.pop(DJANGO_CT).split('.')
+            pk = stored.pop(DJANGO_ID)
+            stored.pop(STORED_IDENTIFIER, None)
+            try:
+                index = unified_index.get_index(haystack_get_model(app_label, model_name))
+            except (LookupError, NotHandled):
+                index = None
+            fields = {}
+            for fieldname, value in stored.items():
+                field = index.fields.get(fieldname) if index else None
+                fields[fieldname] = to_python(field, value)
+            results.append(result_class(app_label, model_name, pk, score, **fields))
+        return results
+
+
+def _sort_key(value):
+    return (0, '') if value is None else (1, value)
+
+
+class LocalSearchQuery(BaseSearchQuery):
+
+    def build_query(self):
+        return json.dumps(self._serialize_node(self.query_filter), ensure_ascii=False)
+
+    def _serialize_node(self, node):
+        children = []
+        for child in node.children:
+            if hasattr(child, 'children'):
+                children.append(self._serialize_node(child))
+                continue
+            expression, value = child
+            field, filter_type = node.split_expression(expression)
+            children.append(self._serialize_leaf(field, filter_type, value))
+        return {'connector': node.connector, 'negated': node.negated, 'children': children}
+
+    def _serialize_leaf(self, field, filter_type, value):
+        if field != 'content':
+            field = connections[self._using].get_unified_index().get_index_fieldname(field)
+        if isinstance(value, BaseInput):
+            value = value.query_string
+        if isinstance(value, (list, tuple, set)):
+            value = [to_storable(v) for v in value]
+        else:
+            value = to_storable(value)
+        return {'field': field, 'filter_type': filter_type, 'value': value}
+
+    def build_query_fragment(self, field, filter_type, value):
+        return json.dumps(self._serialize_leaf(field, filter_type, value), ensure_ascii=False)
+
+
+class LocalSearchEngine(BaseEngine):
+    backend = LocalSearchBackend
+    query = LocalSearchQuery
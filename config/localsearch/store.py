@@ -0,0 +1,504 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+磁盘倒排索引的存储
+索引目录结构：
+    CURRENT             当前使用的索引段名称，整体替换该文件即可原子切换（相当于别名）
+    write.lock          写入锁
+    rebuild.json        重建开始时的段名称和delta.log位置，重建期间存在
+    seg_<n>/meta.json       文档数、总词数、文档标识列表
+    seg_<n>/lexicon.json    词 -> [倒排表起始位置, 文档频率]
+    seg_<n>/postings.bin    倒排表，(文档号, 词频) 两个uint32为一项
+    seg_<n>/docs.bin        每个文档的 (存储字段偏移, 存储字段长度, 文档词数)
+    seg_<n>/stored.bin      存储字段，utf8 JSON
+    seg_<n>/delta.log       段生成后的增量操作，每行一条JSON
+倒排表和存储字段通过mmap读取；增量操作追加到delta.log，超过阈值后合并为新段
+"""
+import array
+import fcntl
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+CURRENT = 'CURRENT'
+LOCK = 'write.lock'
+DELTA = 'delta.log'
+REBUILD = 'rebuild.json'
+
+_DOC_STRUCT = struct.Struct('<QII')
+_POSTING_SIZE = 8
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def delta_ref(identifier):
+    """
+    增量文档的引用；段内文档的引用是文档号(int)
+    标识可能是任意可JSON序列化的值（包括int），因此增量文档的引用加上标记，不能直接用标识区分
+    """
+    return ('delta', identifier)
+
+
+def is_delta_ref(ref):
+    return isinstance(ref, tuple)
+
+
+def _mmap(file_path):
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_current(path):
+    try:
+        with open(os.path.join(path, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def write_lock(path):
+    """进程间写入锁"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK), 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def new_segment_name():
+    return 'seg_{}'.format(time.time_ns())
+
+
+def write_segment(path, docs, name=None):
+    """
+    写入一个新段（不切换CURRENT）
+    :param path: 索引目录
+    :param docs: 可迭代的 (标识, {词: 词频}, 文档词数, 存储字段dict)
+    :param name: 段名称，默认自动生成
+    :return: 段名称
+    """
+    name = name or new_segment_name()
+    seg_path = os.path.join(path, name)
+    os.makedirs(seg_path)
+    ids = []
+    inverted = {}
+    total_length = 0
+    with open(os.path.join(seg_path, 'docs.bin'), 'wb') as docs_file, \
+            open(os.path.join(seg_path, 'stored.bin'), 'wb') as stored_file:
+        offset = 0
+        for docnum, (identifier, terms, length, stored) in enumerate(docs):
+            ids.append(identifier)
+            total_length += length
+            for term, tf in terms.items():
+                inverted.setdefault(term, []).append((docnum, tf))
+            blob = json.dumps(stored, ensure_ascii=False).encode('utf8')
+            stored_file.write(blob)
+            docs_file.write(_DOC_STRUCT.pack(offset, len(blob), length))
+            offset += len(blob)
+
+    lexicon = {}
+    position = 0
+    with open(os.path.join(seg_path, 'postings.bin'), 'wb') as postings_file:
+        for term in sorted(inverted):
+            postings = inverted[term]
+            flat = array.array('I')
+            for docnum, tf in postings:
+                flat.append(docnum)
+                flat.append(tf)
+            postings_file.write(flat.tobytes())
+            lexicon[term] = [position, len(postings)]
+            position += len(postings)
+    with open(os.path.join(seg_path, 'lexicon.json'), 'w', encoding='utf8') as f:
+        json.dump(lexicon, f, ensure_ascii=False)
+    with open(os.path.join(seg_path, 'meta.json'), 'w', encoding='utf8') as f:
+        json.dump({'doc_count': len(ids), 'total_length': total_length, 'ids': ids}, f, ensure_ascii=False)
+    open(os.path.join(seg_path, DELTA), 'a').close()
+    return name
+
+
+def switch_segment(path, name, keep=2):
+    """
+    原子地将CURRENT指向新段，并删除较旧的段（保留最近keep个，正在读取旧段的进程不受影响）
+    """
+    tmp = os.path.join(path, CURRENT + '.tmp')
+    with open(tmp, 'w') as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, CURRENT))
+    segments = sorted(d for d in os.listdir(path) if d.startswith('seg_') and d != name)
+    for old in segments[:max(len(segments) - (keep - 1), 0)]:
+        shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+
+
+def ensure_index(path):
+    """索引目录不存在时创建空索引"""
+    if read_current(path):
+        return
+    with write_lock(path):
+        if not read_current(path):
+            switch_segment(path, write_segment(path, []))
+
+
+class Segment(object):
+    """只读索引段"""
+    def __init__(self, seg_path):
+        with open(os.path.join(seg_path, 'meta.json'), encoding='utf8') as f:
+            meta = json.load(f)
+        with open(os.path.join(seg_path, 'lexicon.json'), encoding='utf8') as f:
+            self.lexicon = json.load(f)
+        self.ids = meta['ids']
+        self.doc_count = meta['doc_count']
+        self.total_length = meta['total_length']
+        self._postings = _mmap(os.path.join(seg_path, 'postings.bin'))
+        self._docs = _mmap(os.path.join(seg_path, 'docs.bin'))
+        self._stored = _mmap(os.path.join(seg_path, 'stored.bin'))
+        self._docnums = None
+
+    @property
+    def docnums(self):
+        """标识 -> 文档号"""
+        if self._docnums is None:
+            self._docnums = {identifier: docnum for docnum, identifier in enumerate(self.ids)}
+        return self._docnums
+
+    def postings(self, term):
+        """:return: [(文档号, 词频), ...]"""
+        entry = self.lexicon.get(term)
+        if not entry:
+            return []
+        position, df = entry
+        flat = array.array('I')
+        flat.frombytes(self._postings[position * _POSTING_SIZE:(position + df) * _POSTING_SIZE])
+        return list(zip(flat[0::2], flat[1::2]))
+
+    def doc_length(self, docnum):
+        return _DOC_STRUCT.unpack_from(self._docs, docnum * _DOC_STRUCT.size)[2]
+
+    def stored(self, docnum):
+        offset, size, _ = _DOC_STRUCT.unpack_from(self._docs, docnum * _DOC_STRUCT.size)
+        return json.loads(bytes(self._stored[offset:offset + size]).decode('utf8'))
+
+    def close(self):
+        for m in (self._postings, self._docs, self._stored):
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+
+class IndexSnapshot(object):
+    """
+    某一时刻的当前段加上delta.log中的增量操作，创建后不再修改，可以被多个线程同时读取
+    文档引用：段内文档用文档号(int)，增量文档用 delta_ref(标识)
+    """
+    def __init__(self, segment=None, segment_name=None, delta_offset=0,
+                 delta_docs=None, overridden=None, overridden_length=0):
+        self.segment = segment
+        self.segment_name = segment_name
+        self.delta_offset = delta_offset
+        # 标识 -> ({词: 词频}, 文档词数, 存储字段)
+        self.delta_docs = delta_docs if delta_docs is not None else {}
+        # 被增量更新或删除覆盖的段内文档号
+        self.overridden = overridden if overridden is not None else set()
+        self.overridden_length = overridden_length
+        self._delta_postings = None
+
+    def extend(self, ops, consumed):
+        """
+        :param consumed: ops在delta.log中占用的字节数
+        :return: 复制增量后应用ops得到的新快照，自身不变
+        """
+        snapshot = IndexSnapshot(self.segment, self.segment_name, self.delta_offset + consumed,
+                                 dict(self.delta_docs), set(self.overridden), self.overridden_length)
+        for op in ops:
+            snapshot._apply(op)
+        return snapshot
+
+    def _override(self, identifier):
+        docnum = self.segment.docnums.get(identifier) if self.segment else None
+        if docnum is not None and docnum not in self.overridden:
+            self.overridden.add(docnum)
+            self.overridden_length += self.segment.doc_length(docnum)
+
+    def _apply(self, op):
+        identifier = op['id']
+        self._override(identifier)
+        if op['op'] == 'update':
+            self.delta_docs[identifier] = (op['terms'], op['length'], op['stored'])
+        else:
+            self.delta_docs.pop(identifier, None)
+
+    @property
+    def delta_postings(self):
+        # 多个线程同时首次访问时各自计算一次，结果相同
+        if self._delta_postings is None:
+            inverted = {}
+            for identifier, (terms, _, _) in self.delta_docs.items():
+                ref = delta_ref(identifier)
+                for term, tf in terms.items():
+                    inverted.setdefault(term, {})[ref] = tf
+            self._delta_postings = inverted
+        return self._delta_postings
+
+    # 统计信息
+
+    @property
+    def doc_count(self):
+        base = self.segment.doc_count if self.segment else 0
+        return base - len(self.overridden) + len(self.delta_docs)
+
+    @property
+    def avg_length(self):
+        base = self.segment.total_length if self.segment else 0
+        total = base - self.overridden_length + sum(d[1] for d in self.delta_docs.values())
+        count = self.doc_count
+        return total / count if count else 0.0
+
+    # 文档访问
+
+    def live_refs(self):
+        if self.segment:
+            overridden = self.overridden
+            for docnum in range(self.segment.doc_count):
+                if docnum not in overridden:
+                    yield docnum
+        for identifier in self.delta_docs:
+            yield delta_ref(identifier)
+
+    def identifier(self, ref):
+        return ref[1] if is_delta_ref(ref) else self.segment.ids[ref]
+
+    def doc_length(self, ref):
+        return self.delta_docs[ref[1]][1] if is_delta_ref(ref) else self.segment.doc_length(ref)
+
+    def stored(self, ref):
+        return self.delta_docs[ref[1]][2] if is_delta_ref(ref) else self.segment.stored(ref)
+
+    def postings(self, term):
+        """:return: {文档引用: 词频}，已排除被覆盖的文档"""
+        result = {}
+        if self.segment:
+            overridden = self.overridden
+            for docnum, tf in self.segment.postings(term):
+                if docnum not in overridden:
+                    result[docnum] = tf
+        result.update(self.delta_postings.get(term, {}))
+        return result
+
+    def all_terms(self, ref):
+        """增量文档的全部词及词频（段内文档需要扫描词典，见 iter_documents）"""
+        return self.delta_docs[ref[1]][0]
+
+    def match(self, token_groups):
+        """
+        每组词都必须出现（组内为一个查询词切分出的词），按BM25打分
+        :param token_groups: [[词, ...], ...]
+        :return: {文档引用: 分数}
+        """
+        tokens = []
+        for group in token_groups:
+            for token in group:
+                if token not in tokens:
+                    tokens.append(token)
+        if not tokens:
+            return {}
+        postings = {token: self.postings(token) for token in tokens}
+        # 从最短的倒排表开始求交集
+        ordered = sorted(tokens, key=lambda t: len(postings[t]))
+        candidates = set(postings[ordered[0]])
+        for token in ordered[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(postings[token])
+        if not candidates:
+            return {}
+
+        n = self.doc_count
+        avg_length = self.avg_length or 1.0
+        lengths = {ref: self.doc_length(ref) for ref in candidates}
+        scores = dict.fromkeys(candidates, 0.0)
+        for token in tokens:
+            token_postings = postings[token]
+            df = len(token_postings)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for ref in candidates:
+                tf = token_postings[ref]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ref] / avg_length)
+                scores[ref] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def iter_documents(self):
+        """
+        遍历全部有效文档，合并段时使用
+        :return: 可迭代的 (标识, {词: 词频}, 文档词数, 存储字段)
+        """
+        if self.segment:
+            per_doc = {}
+            overridden = self.overridden
+            for term in self.segment.lexicon:
+                for docnum, tf in self.segment.postings(term):
+                    if docnum not in overridden:
+                        per_doc.setdefault(docnum, {})[term] = tf
+            for docnum in range(self.segment.doc_count):
+                if docnum not in overridden:
+                    yield (self.segment.ids[docnum], per_doc.get(docnum, {}),
+                           self.segment.doc_length(docnum), self.segment.stored(docnum))
+        for identifier, (terms, length, stored) in self.delta_docs.items():
+            yield identifier, terms, length, stored
+
+
+class IndexReader(object):
+    """
+    进程内共用的读取器，refresh() 在锁内检查CURRENT和delta.log的变化，
+    有变化时生成新的快照替换旧快照；已经取得的快照不受影响
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.snapshot = IndexSnapshot()
+
+    def refresh(self):
+        """只读取delta.log新增的部分，:return: 最新的快照"""
+        with self._lock:
+            snapshot = self.snapshot
+            name = read_current(self.path)
+            if name != snapshot.segment_name:
+                # 旧段不主动关闭，其他线程可能仍在读取旧快照，随对象回收释放
+                snapshot = IndexSnapshot(Segment(os.path.join(self.path, name)) if name else None, name)
+            if snapshot.segment_name:
+                delta_path = os.path.join(self.path, snapshot.segment_name, DELTA)
+                try:
+                    size = os.path.getsize(delta_path)
+                except FileNotFoundError:
+                    size = 0
+                if size > snapshot.delta_offset:
+                    with open(delta_path, 'rb') as f:
+                        f.seek(snapshot.delta_offset)
+                        data = f.read(size - snapshot.delta_offset)
+                    # 只处理完整的行，写了一半的行留到下次
+                    end = data.rfind(b'\n') + 1
+                    if end:
+                        ops = [json.loads(line.decode('utf8')) for line in data[:end].splitlines() if line.strip()]
+                        snapshot = snapshot.extend(ops, end)
+            self.snapshot = snapshot
+            return snapshot
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def get_reader(path):
+    """每个进程每个索引目录共用一个读取器，每次使用前刷新，:return: IndexSnapshot"""
+    with _readers_lock:
+        reader = _readers.get(path)
+        if reader is None:
+            ensure_index(path)
+            reader = _readers[path] = IndexReader(path)
+    return reader.refresh()
+
+
+def append_ops(path, ops, merge_bytes=None):
+    """
+    追加增量操作，delta.log超过merge_bytes时合并为新段
+    :param ops: [{'op': 'update', 'id': ..., 'terms': ..., 'length': ..., 'stored': ...}
+                 或 {'op': 'delete', 'id': ...}, ...]
+    """
+    if not ops:
+        return
+    ensure_index(path)
+    with write_lock(path):
+        name = read_current(path)
+        delta_path = os.path.join(path, name, DELTA)
+        with open(delta_path, 'ab') as f:
+            for op in ops:
+                f.write(json.dumps(op, ensure_ascii=False).encode('utf8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        # 重建期间不自动合并，否则重建开始后的增量会并入段中，切换时无法重放
+        if merge_bytes and os.path.getsize(delta_path) > merge_bytes and not _read_rebuild(path):
+            _merge_locked(path)
+
+
+def _merge_locked(path):
+    reader = IndexReader(path).refresh()
+    name = write_segment(path, reader.iter_documents())
+    reader.segment.close()
+    switch_segment(path, name)
+
+
+def merge(path):
+    """将增量合并进新段"""
+    ensure_index(path)
+    with write_lock(path):
+        _merge_locked(path)
+
+
+def _read_rebuild(path):
+    try:
+        with open(os.path.join(path, REBUILD), encoding='utf8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def begin_rebuild(path):
+    """
+    记录当前段和delta.log的位置，此后写入的增量由 finish_rebuild 重放到新段
+    重建中断时记录会留下，自动合并暂停到下一次重建完成
+    """
+    ensure_index(path)
+    with write_lock(path):
+        name = read_current(path)
+        position = {'segment': name, 'offset': os.path.getsize(os.path.join(path, name, DELTA))}
+        tmp = os.path.join(path, REBUILD + '.tmp')
+        with open(tmp, 'w', encoding='utf8') as f:
+            json.dump(position, f)
+        os.replace(tmp, os.path.join(path, REBUILD))
+
+
+def finish_rebuild(path, name):
+    """
+    把重建开始后写入当前段delta.log的增量追加到新段name，再切换CURRENT
+    :return: 重放的字节数
+    """
+    with write_lock(path):
+        position = _read_rebuild(path)
+        current = read_current(path)
+        # 重建期间手动合并或清空过时，开始后的增量已并入当前段，只能重放当前段的全部增量
+        offset = position['offset'] if position and position['segment'] == current else 0
+        replayed = 0
+        if current:
+            with open(os.path.join(path, current, DELTA), 'rb') as src:
+                src.seek(offset)
+                data = src.read()
+            if data:
+                with open(os.path.join(path, name, DELTA), 'ab') as dst:
+                    dst.write(data)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                replayed = len(data)
+        switch_segment(path, name)
+        try:
+            os.remove(os.path.join(path, REBUILD))
+        except FileNotFoundError:
+            pass
+        return replayed
+
+
+def reset(path):
+    """清空索引"""
+    with write_lock(path):
+        switch_segment(path, write_segment(path, []))
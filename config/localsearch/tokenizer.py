@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+分词
+中文按相邻两字切分（单字成词时保留单字），英文、数字按单词切分并转为小写
+"""
+import re
+import unicodedata
+
+# 连续的中日韩文字，或连续的字母数字
+_TOKEN_RE = re.compile(r'([㐀-䶿一-鿿豈-﫿]+)|([0-9a-z_]+)')
+
+
+def normalize(text):
+    """全角转半角（NFKC）并转为小写"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text):
+    """
+    :param text: 文本
+    :return: 词列表，保持原有顺序
+    """
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(normalize(text)):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
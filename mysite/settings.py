@@ -240,12 +240,17 @@ HAYSTACK_CONNECTIONS = {
         'URL': 'http://127.0.0.1:8002/',  # 此处为elasticsearch运行的服务器ip地址，端口号默认为9200
         'INDEX_NAME': 'mysite',  # 指定elasticsearch建立的索引库的名称
     },
+    # 本地磁盘索引，不依赖elasticsearch；开发环境可将其改名为default使用
+    'local': {
+        'ENGINE': 'config.localsearch.backend.LocalSearchEngine',
+        'PATH': os.path.join(BASE_DIR, 'search_index'),
+    },
 }
 
 # 设置每页显示的数据量
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 5
-# 当数据库改变时，会自动更新索引
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# 数据库改变时将索引任务放入redis队列，由 process_search_queue 命令批量更新
+HAYSTACK_SIGNAL_PROCESSOR = 'news.search_queue.QueuedSignalProcessor'
 
 # 站点域名和端口配置
 SITE_DOMAIN_PORT = "http://127.0.0.1:8000"
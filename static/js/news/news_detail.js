@@ -46,19 +46,19 @@ $(function () {
           <li class="comment-item">
             <div class="comment-info clearfix">
               <img src="/static/images/avatar.jpeg" alt="avatar" class="comment-avatar">
-              <span class="comment-user">${one_comment.author}</span>
+              <span class="comment-user">${escapeHtml(one_comment.author)}</span>
             </div>
-            <div class="comment-content">${one_comment.content}</div>
+            <div class="comment-content">${escapeHtml(one_comment.content)}</div>
 
                 <div class="parent_comment_text">
-                  <div class="parent_username">${one_comment.parent.author}</div>
+                  <div class="parent_username">${escapeHtml(one_comment.parent.author)}</div>
                   <br/>
                   <div class="parent_content_text">
-                    ${one_comment.parent.content}
+                    ${escapeHtml(one_comment.parent.content)}
                   </div>
                 </div>
 
-              <div class="comment_time left_float">${one_comment.update_time}</div>
+              <div class="comment_time left_float">${escapeHtml(one_comment.update_time)}</div>
               <a href="javascript:;" class="reply_a_tag right_float">回复</a>
               <form class="reply_form left_float" comment-id="${one_comment.content_id}" news-id="${one_comment.news_id}">
                 <textarea class="reply_input"></textarea>
@@ -151,11 +151,11 @@ $(function () {
           <li class="comment-item">
             <div class="comment-info clearfix">
               <img src="/static/images/avatar.jpeg" alt="avatar" class="comment-avatar">
-              <span class="comment-user">${one_comment.author}</span>
+              <span class="comment-user">${escapeHtml(one_comment.author)}</span>
             </div>
-            <div class="comment-content">${one_comment.content}</div>
+            <div class="comment-content">${escapeHtml(one_comment.content)}</div>
 
-              <div class="comment_time left_float">${one_comment.update_time}</div>
+              <div class="comment_time left_float">${escapeHtml(one_comment.update_time)}</div>
               <a href="javascript:;" class="reply_a_tag right_float">回复</a>
               <form class="reply_form left_float" comment-id="${one_comment.content_id}" news-id="${one_comment.news_id}">
                 <textarea class="reply_input"></textarea>
@@ -187,6 +187,83 @@ $(function () {
       });
   });
 
+  // 滚动加载更多评论
+  let $commentList = $('.comment-list');
+  let sNextCursor = $commentList.attr('data-next-cursor');
+  let bIsLoadComments = false;   // 是否正在向后台加载评论
+
+  $(window).scroll(function () {
+    // 页面可以滚动的距离
+    let canScrollHeight = $(document).height() - $(window).height();
+    if ((canScrollHeight - $(document).scrollTop()) < 100 && sNextCursor && !bIsLoadComments) {
+      fn_load_comments();
+    }
+  });
+
+  function fn_load_comments() {
+    bIsLoadComments = true;
+    $.ajax({
+      url: "/news/" + $commentList.attr('news-id') + "/comments/",
+      type: "GET",
+      data: {"cursor": sNextCursor},
+      dataType: "json",
+    })
+      .done(function (res) {
+        if (res.errno === "0") {
+          res.data.comments.forEach(function (one_comment) {
+            let html_parent = ``;
+            if (one_comment.parent) {
+              html_parent = `
+                <div class="parent_comment_text">
+                  <div class="parent_username">${escapeHtml(one_comment.parent.author)}</div>
+                  <br/>
+                  <div class="parent_content_text">
+                    ${escapeHtml(one_comment.parent.content)}
+                  </div>
+                </div>`;
+            }
+            let html_comment = `
+          <li class="comment-item">
+            <div class="comment-info clearfix">
+              <img src="/static/images/avatar.jpeg" alt="avatar" class="comment-avatar">
+              <span class="comment-user">${escapeHtml(one_comment.author)}</span>
+            </div>
+            <div class="comment-content">${escapeHtml(one_comment.content)}</div>
+              ${html_parent}
+              <div class="comment_time left_float">${escapeHtml(one_comment.update_time)}</div>
+              <a href="javascript:;" class="reply_a_tag right_float">回复</a>
+              <form class="reply_form left_float" comment-id="${one_comment.content_id}" news-id="${one_comment.news_id}">
+                <textarea class="reply_input"></textarea>
+                <input type="button" value="回复" class="reply_btn right_float">
+                <input type="reset" name="" value="取消" class="reply_cancel right_float">
+              </form>
+
+          </li>`;
+            $commentList.append(html_comment);
+          });
+          sNextCursor = res.data.next_cursor;
+        } else {
+          message.showError(res.errmsg);
+        }
+      })
+      .fail(function () {
+        message.showError('服务器超时，请重试！');
+      })
+      .always(function () {
+        bIsLoadComments = false;
+      });
+  }
+
+  // 评论内容由其他用户填写，拼接进HTML前必须转义
+  function escapeHtml(value) {
+    return String(value === null || value === undefined ? '' : value)
+      .replace(/&/g, '&amp;')
+      .replace(/</g, '&lt;')
+      .replace(/>/g, '&gt;')
+      .replace(/"/g, '&quot;')
+      .replace(/'/g, '&#39;');
+  }
+
   // get cookie using jQuery
   function getCookie(name) {
     let cookieValue = null;
@@ -0,0 +1,40 @@
+// 在static/js/news/search.js文件中
+
+$(function () {
+  // 搜索框输入提示
+  let $searchInput = $(".search-control");
+  let $suggestList = $("#search-suggest");
+  let sLastQuery = '';
+  let iTimer = null;
+
+  $searchInput.on('input', function () {
+    // 停止输入一段时间后再请求，避免每个按键都请求
+    clearTimeout(iTimer);
+    iTimer = setTimeout(fn_load_suggest, 150);
+  });
+
+  function fn_load_suggest() {
+    let sQuery = $.trim($searchInput.val());
+    if (!sQuery || sQuery === sLastQuery) {
+      return
+    }
+    sLastQuery = sQuery;
+    $.ajax({
+      url: $searchInput.data('suggest-url'),
+      type: "GET",
+      data: {q: sQuery},
+      dataType: "json"
+    })
+      .done(function (res) {
+        if (res.errno === "0" && sQuery === sLastQuery) {
+          $suggestList.empty();
+          res.data.suggestions.forEach(function (one_suggest) {
+            $suggestList.append($('<option>').attr('value', one_suggest.text));
+          });
+        }
+      })
+      .fail(function () {
+        console.log('搜索提示加载失败');
+      });
+  }
+});
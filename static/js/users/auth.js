@@ -101,6 +101,8 @@ $(function () {
           }, 1000);
         } else {
           message.showError(res.errmsg);
+          // 图片验证码校验后即失效，需要换一张
+          generateImageCode();
         }
       })
       .fail(function(){